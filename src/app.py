@@ -5,6 +5,7 @@ from src.db import check_db_connected, check_db_disconnected
 from src.routes import router
 from src.auth.init_superuser import create_initial_superuser
 from src.cache import global_cache
+from src.response import close_shared_session
 
 
 def include_router(application: FastAPI) -> None:
@@ -49,6 +50,7 @@ async def startup() -> None:
 async def shutdown() -> None:
     await check_db_disconnected()
     await global_cache.disconnect()
+    await close_shared_session()
 
 
 @app.get('/', status_code=status.HTTP_200_OK)
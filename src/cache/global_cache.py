@@ -509,11 +509,9 @@ class GlobalCache:
         logger.info("5/5: Применение трехуровневой системы для delivery (Redis → PostgreSQL → WB API)...")
 
         # Формируем список запрашиваемых поставок для проверки в БД
-        requested_supplies = []
-        for account_data in filtered_delivery_supplies_ids:
-            for account, supplies_list in account_data.items():
-                for supply in supplies_list:
-                    requested_supplies.append((supply['id'], account))
+        requested_supplies = [(supply['id'], account)
+                              for account, supplies_list in filtered_delivery_supplies_ids.items()
+                              for supply in supplies_list]
 
         logger.info(f"Запрошено {len(requested_supplies)} delivery поставок для кэширования")
 
@@ -679,7 +677,7 @@ class GlobalCache:
     async def _filter_delivery_supplies_ultra_optimized(
         self,
         delivery_supplies_data: Dict[tuple, Dict],  # ИЗМЕНЕНО: теперь принимаем данные из БД
-        delivery_supplies_ids: List[Dict],
+        delivery_supplies_ids: Dict[str, List[Dict]],
         hanging_only: bool,
         supplies_service
     ) -> SupplyIdResponseSchema:
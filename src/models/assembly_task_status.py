@@ -4,7 +4,7 @@
 Таблица содержит историю статусов сборочных заданий (заказов) Wildberries.
 Используется для получения данных заказов без обращения к WB API.
 """
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable
 from src.logger import app_logger as logger
 
 
@@ -160,3 +160,67 @@ class AssemblyTaskStatus:
                 f"для аккаунта {account}: {str(e)}"
             )
             return {}
+
+    async def get_order_statuses_by_accounts(
+        self,
+        order_ids_by_account: Dict[str, Iterable[int]]
+    ) -> Dict[str, Dict[int, Dict[str, Any]]]:
+        """
+        Получает актуальные статусы заказов сразу для нескольких аккаунтов одним запросом.
+
+        Аналог get_order_statuses_batch, но вместо отдельного запроса на каждый аккаунт
+        передает пары (account, order_id) массивами и соединяет их с таблицей через unnest.
+
+        Args:
+            order_ids_by_account: Словарь {account: [order_id, ...]}
+
+        Returns:
+            Dict[str, Dict[int, Dict[str, Any]]]: {account: {order_id: {'wb_status': '...', 'supplier_status': '...'}}}
+            Аккаунты без найденных заказов в результат не попадают.
+        """
+        accounts = []
+        order_ids = []
+        for account, account_order_ids in order_ids_by_account.items():
+            for order_id in account_order_ids:
+                accounts.append(account)
+                order_ids.append(order_id)
+
+        if not order_ids:
+            logger.debug("Пустой список order_ids для получения статусов")
+            return {}
+
+        try:
+            query = """
+                SELECT DISTINCT ON (s.account, s.id)
+                    s.account,
+                    s.id,
+                    s.wb_status,
+                    s.supplier_status
+                FROM assembly_task_status_model s
+                JOIN unnest($1::text[], $2::bigint[]) AS req(account, id)
+                  ON s.account = req.account AND s.id = req.id
+                ORDER BY s.account, s.id, s.created_at_db DESC
+            """
+
+            result = await self.db.fetch(query, accounts, order_ids)
+
+            statuses: Dict[str, Dict[int, Dict[str, Any]]] = {}
+            for row in result:
+                statuses.setdefault(row["account"], {})[row["id"]] = {
+                    "wb_status": row["wb_status"],
+                    "supplier_status": row["supplier_status"]
+                }
+
+            logger.info(
+                f"Получено {sum(len(v) for v in statuses.values())} статусов из {len(order_ids)} запрошенных "
+                f"заказов из assembly_task_status_model для {len(order_ids_by_account)} аккаунтов"
+            )
+
+            return statuses
+
+        except Exception as e:
+            logger.error(
+                f"Ошибка получения статусов из assembly_task_status_model "
+                f"для аккаунтов {list(order_ids_by_account)}: {str(e)}"
+            )
+            return {}
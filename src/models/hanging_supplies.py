@@ -1,4 +1,6 @@
 import json
+import time
+import orjson
 from typing import List, Dict, Any, Optional, Set, Tuple
 from datetime import datetime, timedelta
 
@@ -7,6 +9,9 @@ from numpy import record
 from src.logger import app_logger as logger
 from src.supplies.schema import HangingSuppliesWithOverdueOrders
 
+# Время жизни кэша списка висячих поставок в секундах: состав меняется с "человеческой" скоростью
+HANGING_SUPPLIES_CACHE_TTL = 10
+
 
 class HangingSupplies:
     """
@@ -29,9 +34,20 @@ class HangingSupplies:
         fictitious_delivery_operator (varchar): Оператор фиктивной доставки
     """
 
+    # Кэш списка висячих поставок, общий для процесса: (время получения, данные)
+    _hanging_supplies_cache: Optional[Tuple[float, List[Dict[str, Any]]]] = None
+    # Поколение кэша: растет при каждом сбросе, чтобы чтение, начатое до записи, не попало в кэш
+    _hanging_supplies_cache_generation: int = 0
+
     def __init__(self, db):
         self.db = db
 
+    @classmethod
+    def invalidate_cache(cls) -> None:
+        """Сбрасывает кэш списка висячих поставок. Вызывается после любой записи в таблицу."""
+        cls._hanging_supplies_cache = None
+        cls._hanging_supplies_cache_generation += 1
+
     async def save_hanging_supply(self, supply_id: str, account: str, order_data: str, operator: str = 'unknown') -> bool:
         """
         Сохраняет информацию о висячей поставке в БД.
@@ -52,6 +68,7 @@ class HangingSupplies:
             RETURNING id
             """
             result = await self.db.fetchrow(query, supply_id, account, order_data, operator)
+            self.invalidate_cache()
             return result is not None
         except Exception as e:
             logger.error(f"Ошибка при сохранении висячей поставки: {str(e)}")
@@ -66,16 +83,46 @@ class HangingSupplies:
             List[Dict[str, Any]]: Список висячих поставок
         """
         try:
-            query = """
-            SELECT * FROM public.hanging_supplies
-            ORDER BY created_at DESC
-            LIMIT 1000
-            """
-            result = await self.db.fetch(query)
-            return [dict(row) for row in result]
+            return await self._fetch_hanging_supplies()
         except Exception as e:
             logger.error(f"Ошибка при получении висячих поставок: {str(e)}")
             return []
+
+    async def _fetch_hanging_supplies(self) -> List[Dict[str, Any]]:
+        """Читает висячие поставки из БД. Ошибки не перехватывает."""
+        query = """
+        SELECT * FROM public.hanging_supplies
+        ORDER BY created_at DESC
+        LIMIT 1000
+        """
+        result = await self.db.fetch(query)
+        return [dict(row) for row in result]
+
+    async def get_hanging_supplies_cached(self, ttl: float = HANGING_SUPPLIES_CACHE_TTL) -> List[Dict[str, Any]]:
+        """
+        Возвращает список висячих поставок из кэша, если он моложе ttl секунд, иначе читает из БД.
+        Args:
+            ttl: Допустимый возраст кэша в секундах
+        Returns:
+            List[Dict[str, Any]]: Список висячих поставок (копии строк кэша)
+        """
+        cached = HangingSupplies._hanging_supplies_cache
+        if cached is not None and time.monotonic() - cached[0] < ttl:
+            rows = cached[1]
+        else:
+            generation = HangingSupplies._hanging_supplies_cache_generation
+            try:
+                rows = await self._fetch_hanging_supplies()
+            except Exception as e:
+                # Пустой результат при ошибке БД не кэшируем - следующий вызов повторит запрос
+                logger.error(f"Ошибка при получении висячих поставок: {str(e)}")
+                return []
+            # Если во время запроса кэш сбросили, прочитанные строки могут быть устаревшими
+            if generation == HangingSupplies._hanging_supplies_cache_generation:
+                HangingSupplies._hanging_supplies_cache = (time.monotonic(), rows)
+
+        # Строки кэша общие для всех вызовов - отдаем копии, чтобы изменения вызывающих их не портили
+        return [dict(row) for row in rows]
     
     async def update_changes_log(self, supply_id: str, account: str, changes_log_entries: List[Dict[str, Any]]) -> bool:
         """
@@ -97,6 +144,7 @@ class HangingSupplies:
             RETURNING id
             """
             result = await self.db.fetchrow(query, supply_id, account, json.dumps(changes_log_entries))
+            self.invalidate_cache()
             success = result is not None
             if success:
                 logger.debug(f"Обновлен changes_log для поставки {supply_id} ({account})")
@@ -203,6 +251,7 @@ class HangingSupplies:
             RETURNING id
             """
             result = await self.db.fetchrow(query, supply_id, account, json.dumps(shipped_orders))
+            self.invalidate_cache()
             success = result is not None
             if success:
                 logger.info(f"Обновлен shipped_orders для поставки {supply_id} ({account}): добавлено {len(shipped_orders)} заказов")
@@ -264,6 +313,7 @@ class HangingSupplies:
             """
             
             await self.db.execute(query, cutoff_timestamp)
+            self.invalidate_cache()
             
             # Получаем статистику после очистки
             stats_query = """
@@ -339,6 +389,7 @@ class HangingSupplies:
             RETURNING id
             """
             result = await self.db.fetchrow(query, supply_id, account, json.dumps(order_data))
+            self.invalidate_cache()
             success = result is not None
             if success:
                 logger.info(f"Обновлен order_data для поставки {supply_id} ({account})")
@@ -365,6 +416,7 @@ class HangingSupplies:
             RETURNING id
             """
             result = await self.db.fetchrow(query, supply_id, account)
+            self.invalidate_cache()
             success = result is not None
             if success:
                 logger.info(f"Удалена висячая поставка {supply_id} ({account})")
@@ -430,6 +482,7 @@ class HangingSupplies:
             RETURNING id
             """
             result = await self.db.fetchrow(query, supply_id, account, operator)
+            self.invalidate_cache()
             success = result is not None
             if success:
                 logger.info(f"Поставка {supply_id} ({account}) помечена как фиктивно доставленная оператором {operator}")
@@ -440,6 +493,42 @@ class HangingSupplies:
             logger.error(f"Ошибка пометки поставки {supply_id} ({account}) как фиктивно доставленной: {str(e)}")
             return False
 
+    async def mark_many_as_fictitious_delivered(self, supplies: List[Tuple[str, str]],
+                                                operator: str = 'unknown') -> Set[Tuple[str, str]]:
+        """
+        Помечает несколько висячих поставок как переведенные в фиктивную доставку одним запросом.
+        
+        Args:
+            supplies: Список пар (supply_id, account)
+            operator: Оператор, переводивший в фиктивную доставку
+            
+        Returns:
+            Set[Tuple[str, str]]: Пары (supply_id, account), которые действительно были помечены
+        """
+        if not supplies:
+            return set()
+        try:
+            query = """
+            UPDATE public.hanging_supplies hs
+            SET is_fictitious_delivered = true,
+                fictitious_delivered_at = CURRENT_TIMESTAMP,
+                fictitious_delivery_operator = $3
+            FROM unnest($1::text[], $2::text[]) AS req(supply_id, account)
+            WHERE hs.supply_id = req.supply_id AND hs.account = req.account
+              AND hs.is_fictitious_delivered = false
+            RETURNING hs.supply_id, hs.account
+            """
+            supply_ids, accounts = zip(*supplies)
+            result = await self.db.fetch(query, list(supply_ids), list(accounts), operator)
+            self.invalidate_cache()
+            marked = {(row['supply_id'], row['account']) for row in result}
+            logger.info(f"Помечено {len(marked)} из {len(supplies)} поставок как фиктивно доставленные "
+                        f"оператором {operator}")
+            return marked
+        except Exception as e:
+            logger.error(f"Ошибка пакетной пометки {len(supplies)} поставок как фиктивно доставленных: {str(e)}")
+            return set()
+
     async def get_fictitious_delivered_supplies(self, limit: int = 100) -> List[Dict[str, Any]]:
         """
         Получает список фиктивно доставленных висячих поставок.
@@ -583,7 +672,7 @@ class HangingSupplies:
             result = await self.db.fetchrow(query, supply_id, account)
             
             if result:
-                shipped_data = json.loads(result['fictitious_shipped_order_ids'])
+                shipped_data = orjson.loads(result['fictitious_shipped_order_ids'])
                 
                 if shipped_data:
                     try:
@@ -624,6 +713,7 @@ class HangingSupplies:
             RETURNING id
             """
             result = await self.db.fetchrow(query, supply_id, account, json.dumps(new_entries))
+            self.invalidate_cache()
             success = result is not None
             if success:
                 logger.info(f"Добавлено {len(order_ids)} фиктивно отгруженных order_id для поставки {supply_id} ({account})")
@@ -704,4 +794,5 @@ class HangingSupplies:
         WHERE supply_id = ANY($1);
         """
 
-        await self.db.execute(update_query, supplies_ids)
\ No newline at end of file
+        await self.db.execute(update_query, supplies_ids)
+        self.invalidate_cache()
\ No newline at end of file
@@ -27,7 +27,7 @@ class ShipmentOfGoods:
 
     async def create_all(self, items: List[Dict[str, Any]]) -> bool:
         """
-        Вставляет все записи одним запросом.
+        Вставляет все записи одной операцией COPY (без разбора SQL и без лимита числа параметров запроса).
         Args:
             items: Список подготовленных словарей с данными для вставки.
         Returns:
@@ -38,34 +38,21 @@ class ShipmentOfGoods:
 
         columns = ["author", "supply_id", "product_id", "warehouse_id",
                    "delivery_type", "wb_warehouse", "account", "quantity"]
-
-        placeholders = []
-        params = []
-
-        for item in items:
-            item_placeholders = []
-            for col in columns:
-                params.append(item.get(col))
-                item_placeholders.append(f"${len(params)}")
-
-            placeholders.append(f"({', '.join(item_placeholders)})")
-
-        query = f"""
-        INSERT INTO public.shipment_of_goods ({', '.join(columns)})
-        VALUES {', '.join(placeholders)}
-        """
+        records = [tuple(item.get(col) for col in columns) for item in items]
 
         try:
-            await self.db.execute(query, *params)
+            await self.db.copy_records_to_table(
+                'shipment_of_goods', records=records, columns=columns, schema_name='public'
+            )
             return True
         except Exception as e:
             logger.error(f"Ошибка при вставке данных: {str(e)}")
             return False
 
-    async def filter_wilds(self):
+    async def filter_wilds(self) -> set:
         query = """SELECT id from products"""
         result =  await self.db.fetch(query)
-        return [i['id'] for i in result]
+        return {i['id'] for i in result}
         
     async def get_weekly_supply_ids(self) -> List[Dict[str, str]]:
         """
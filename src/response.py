@@ -116,6 +116,59 @@ class HttpClient:
         return self.request("PATCH", url, json=json, data=data, headers=headers)
 
 
+# Общая aiohttp-сессия процесса: переиспользует keep-alive соединения между запросами.
+# Сессия привязана к event loop, поэтому для другого loop (например, в задачах celery) создаётся заново.
+_shared_session: Optional[aiohttp.ClientSession] = None
+_shared_session_loop: Optional[asyncio.AbstractEventLoop] = None
+# Задачи закрытия сессий прежних event loop: держим ссылки, пока задачи не завершатся
+_closing_tasks: set = set()
+# Максимум одновременных соединений общей сессии с одним хостом (WB API, 1C). Общего лимита нет:
+# ожидание свободного соединения входит в таймаут запроса, а раньше у каждого запроса была своя сессия
+SHARED_SESSION_CONNECTIONS_PER_HOST = 100
+
+
+async def _close_session_quietly(session: aiohttp.ClientSession) -> None:
+    """Закрывает сессию, не пробрасывая ошибки транспорта уже закрытого event loop."""
+    try:
+        await session.close()
+    except Exception as e:
+        logger.debug(f"Ошибка при закрытии aiohttp-сессии предыдущего event loop: {e}")
+
+
+def _close_stale_session(session: aiohttp.ClientSession, session_loop: asyncio.AbstractEventLoop) -> None:
+    """Закрывает общую сессию, созданную в другом event loop, чтобы не оставлять открытые соединения."""
+    if session_loop.is_running():
+        # Прежний loop работает в другом потоке - закрываем сессию в нём
+        asyncio.run_coroutine_threadsafe(_close_session_quietly(session), session_loop)
+        return
+    # Прежний loop остановлен или закрыт - закрываем сессию из текущего
+    task = asyncio.get_running_loop().create_task(_close_session_quietly(session))
+    _closing_tasks.add(task)
+    task.add_done_callback(_closing_tasks.discard)
+
+
+def get_shared_session() -> aiohttp.ClientSession:
+    """Возвращает общую aiohttp-сессию для текущего event loop, создавая её при необходимости."""
+    global _shared_session, _shared_session_loop
+    loop = asyncio.get_running_loop()
+    if _shared_session is None or _shared_session.closed or _shared_session_loop is not loop:
+        if _shared_session is not None and not _shared_session.closed:
+            _close_stale_session(_shared_session, _shared_session_loop)
+        _shared_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=0, limit_per_host=SHARED_SESSION_CONNECTIONS_PER_HOST))
+        _shared_session_loop = loop
+    return _shared_session
+
+
+async def close_shared_session() -> None:
+    """Закрывает общую aiohttp-сессию. Вызывается при остановке приложения."""
+    global _shared_session, _shared_session_loop
+    if _shared_session is not None and not _shared_session.closed:
+        await _shared_session.close()
+    _shared_session = None
+    _shared_session_loop = None
+
+
 class AsyncHttpClient:
 
     def __init__(self, timeout: int = 120, retries: int = 8, delay: int = 61):
@@ -139,13 +192,13 @@ class AsyncHttpClient:
         """
         for attempt in range(self.retries):
             try:
-                async with aiohttp.ClientSession() as session:
-                    async with session.request(method, url, timeout=self.timeout, **kwargs) as response:
-                        content_type = response.headers.get("Content-Type", "")
-                        response.raise_for_status()
-                        if content_type.startswith("image/"):
-                            return await response.read()
-                        return await response.text()
+                session = get_shared_session()
+                async with session.request(method, url, timeout=self.timeout, **kwargs) as response:
+                    content_type = response.headers.get("Content-Type", "")
+                    response.raise_for_status()
+                    if content_type.startswith("image/"):
+                        return await response.read()
+                    return await response.text()
             except (aiohttp.ClientError, aiohttp.ClientConnectionError) as e:
                 logger.warning(f"Попытка {attempt + 1}: Ошибка во время {method} {url} - {e}")
                 await asyncio.sleep(self.delay)
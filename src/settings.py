@@ -10,7 +10,7 @@ load_dotenv()
 
 class Settings(BaseSettings):
     debug: bool = True
-    tokens: dict = get_wb_tokens()
+    tokens: dict = dict(get_wb_tokens())
     db_app_host: str = os.environ.get("POSTGRES_HOST", "localhost")
     db_app_port: int = os.environ.get("POSTGRES_PORT", 5432)
     db_app_user: str = os.environ.get("POSTGRES_USER")
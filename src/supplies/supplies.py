@@ -3,14 +3,19 @@ import json
 import base64
 import io
 import time
+import heapq
+import orjson
 from typing import List, Dict, Any, Set, Optional, Tuple
 from datetime import datetime
-from collections import defaultdict
+from collections import defaultdict, Counter
+from functools import lru_cache, cached_property
+from operator import itemgetter
+from itertools import chain
 from PIL import Image
 
 from io import BytesIO
 
-from src.service.service_pdf import collect_images_sticker_to_pdf
+from src.service.service_pdf import collect_images_sticker_to_pdf, PDFService
 from src.settings import settings
 from src.logger import app_logger as logger
 from src.supplies.integration_1c import OneCIntegration
@@ -33,16 +38,78 @@ from src.wildberries_api.supplies import Supplies
 
 from src.supplies.schema import (
     SupplyIdResponseSchema, SupplyIdBodySchema, OrderSchema, StickerSchema, SupplyId,
-    SupplyDeleteBody, SupplyDeleteResponse, SupplyDeleteItem, WildFilterRequest, DeliverySupplyInfo,
-    SupplyIdWithShippedBodySchema
+    SupplyDeleteBody, SupplyDeleteResponse, SupplyDeleteItem, WildFilterRequest, WildSupplyItem, WildOrderItem,
+    DeliverySupplyInfo, SupplyIdWithShippedBodySchema
 )
 
+# Значения по умолчанию для товаров без карточки в card_data
+DEFAULT_CARD_META = {"category": "НЕТ Категории", "subject_name": "НЕТ Наименования", "photo_link": "НЕТ ФОТО"}
+# Максимум одновременных запросов стикеров к WB API
+STICKERS_CONCURRENCY = 20
+# Максимум одновременных запросов заказов поставок к WB API при сверке
+SUPPLY_ORDERS_CONCURRENCY = 16
+# Максимум одновременных запросов на удаление поставок к WB API
+DELETE_SUPPLIES_CONCURRENCY = 10
+# Поля заказа, сохраняемые в hanging_supplies.shipped_orders (плюс shipped_at).
+# supply_id не храним: массив и так лежит в строке своей поставки
+SHIPPED_ORDER_FIELDS = ("order_id", "account", "article", "nm_id", "price", "created_at")
+# Суффиксы технических поставок (кириллица и латиница), заменяемые на _ФИНАЛ
+TECH_SUPPLY_SUFFIXES = frozenset(("_ТЕХ", "_TEX"))
+# Статусы WB, при которых заказ активной висячей поставки считается отмененным
+CANCELED_WB_STATUSES = frozenset(('canceled', 'canceled_by_client'))
+# Максимум order_id в одном запросе QR-кодов к qr_scans
+QR_CODES_BATCH_SIZE = 5000
+
+
+@lru_cache(maxsize=4096)
+def _iso_to_timestamp(value: str) -> float:
+    """Переводит ISO-дату WB (в т.ч. с суффиксом Z) в timestamp. Заказы одной поставки часто имеют одну дату."""
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+
+
+@lru_cache(maxsize=512)
+def _convert_current_name_to_final(current_name: Optional[str]) -> str:
+    """Чистое преобразование названия поставки в финальное (см. SuppliesService.convert_current_name_to_final)."""
+    if not current_name:
+        return "Финальная_поставка_ФИНАЛ"
+
+    clean_name = current_name.strip()
+
+    if clean_name.endswith("_ФИНАЛ"):
+        return clean_name  # Уже финальная
+    # Оба технических суффикса (кириллица и латиница) длиной 4 символа — достаточно одного среза
+    if clean_name[-4:] in TECH_SUPPLY_SUFFIXES:
+        return f"{clean_name[:-4]}_ФИНАЛ"
+    return f"{clean_name}_ФИНАЛ"
+
 
 class SuppliesService:
 
     def __init__(self, db: AsyncGenerator = None):
         self.db = db
         self.async_client = AsyncHttpClient(timeout=120, retries=3, delay=5)
+        self.supplies_clients: Dict[str, Supplies] = {}
+        # Запросы информации о поставках в рамках экземпляра: {(supply_id, account): задача}
+        self.supply_info_tasks: Dict[Tuple[str, str], asyncio.Task] = {}
+
+    def _get_supplies_client(self, account: str) -> Optional[Supplies]:
+        """
+        Возвращает клиент WB API поставок для аккаунта, создавая его один раз на экземпляр сервиса.
+        Returns:
+            Optional[Supplies]: Клиент или None, если для аккаунта нет токена
+        """
+        client = self.supplies_clients.get(account)
+        if client is None:
+            wb_tokens = get_wb_tokens()
+            if account not in wb_tokens:
+                return None
+            client = self.supplies_clients[account] = Supplies(account, wb_tokens[account])
+        return client
+
+    @cached_property
+    def one_c_integration(self) -> OneCIntegration:
+        """Интеграция с 1C, создается один раз на экземпляр сервиса при первом обращении."""
+        return OneCIntegration(self.db)
 
     async def get_supply_detailed_info(self, supply_id: str, account: str) -> Optional[Dict[str, Any]]:
         """
@@ -66,20 +133,29 @@ class SuppliesService:
             "cargoType": 0,
             "destinationOfficeId": 123
         }
+
+        Повторные и одновременные вызовы с той же парой (supply_id, account) в рамках экземпляра
+        сервиса ждут один и тот же запрос к WB API.
         """
+        key = (supply_id, account)
+        task = self.supply_info_tasks.get(key)
+        if task is None:
+            task = self.supply_info_tasks[key] = asyncio.ensure_future(
+                self._fetch_supply_detailed_info(supply_id, account))
+        return await asyncio.shield(task)
+
+    async def _fetch_supply_detailed_info(self, supply_id: str, account: str) -> Optional[Dict[str, Any]]:
+        """Запрашивает информацию о поставке из WB API (без мемоизации, см. get_supply_detailed_info)."""
         try:
-            # Получаем токены
-            wb_tokens = get_wb_tokens()
-            if account not in wb_tokens:
+            supplies_api = self._get_supplies_client(account)
+            if supplies_api is None:
                 logger.error(f"Токен для аккаунта {account} не найден")
                 return None
 
-            supplies_api = Supplies(account, wb_tokens[account])
-
             supply_info = await supplies_api.get_information_to_supply(supply_id)
         
             logger.info(f"Получена информация о поставке {supply_id} для аккаунта {account}")
-            logger.debug(f"Данные поставки: {supply_info}")
+            logger.debug("Данные поставки: {}", supply_info)
 
             return supply_info or None
         
@@ -102,17 +178,15 @@ class SuppliesService:
             "Основная поставка_ТЕХ" -> "Основная поставка_ФИНАЛ"
             "Простая поставка" -> "Простая поставка_ФИНАЛ"
         """
-        if not current_name:
-            return "Финальная_поставка_ФИНАЛ"
-
-        clean_name = current_name.strip()
+        return _convert_current_name_to_final(current_name)
 
-        if clean_name.endswith("_ФИНАЛ"):
-            return clean_name  # Уже финальная
-        elif clean_name.endswith("_ТЕХ") or clean_name.endswith("_TEX"):
-            return f"{clean_name[:-4]}_ФИНАЛ"
-        else:
-            return f"{clean_name}_ФИНАЛ"
+    async def _get_first_supply_name(self, account: str, supply_ids: List[str]) -> Optional[str]:
+        """Возвращает название первой из поставок аккаунта, по которой WB API вернул данные."""
+        for supply_id in supply_ids:
+            supply_info = await self.get_supply_detailed_info(supply_id, account)
+            if supply_info:
+                return supply_info.get("name", f"Поставка_{account}")
+        return None
 
     async def get_current_supply_names_for_accounts(
         self, 
@@ -130,51 +204,55 @@ class SuppliesService:
             Dict[str, str]: Словарь {account: supply_name}
         """
         current_supply_names = {}
-        
+
         try:
+            # Кандидаты supply_id из запроса для каждого аккаунта (без обращений к API)
+            candidates: Dict[str, List[str]] = {}
             for wild_code, account in participating_combinations:
-                if account in current_supply_names:
-                    continue  # Уже получили название для этого аккаунта
-                    
-                # Ищем supply_id для этого аккаунта в request_data
-                if wild_code in request_data.orders:
-                    wild_item = request_data.orders[wild_code]
-                    for supply_item in wild_item.supplies:
-                        if supply_item.account == account:
-                            supply_info = await self.get_supply_detailed_info(
-                                supply_item.supply_id, 
-                                account
-                            )
-                            if supply_info:
-                                current_supply_names[account] = supply_info.get("name", f"Поставка_{account}")
-                                logger.info(f"Получено название текущей поставки для {account}: {current_supply_names[account]}")
-                                break
-                
-                # Если не нашли название, используем стандартное
-                if account not in current_supply_names:
+                account_candidates = candidates.setdefault(account, [])
+                wild_item = request_data.orders.get(wild_code)
+                if wild_item is None:
+                    continue
+                for supply_item in wild_item.supplies:
+                    if supply_item.account == account and supply_item.supply_id not in account_candidates:
+                        account_candidates.append(supply_item.supply_id)
+
+            # Аккаунты независимы - запрашиваем названия параллельно
+            accounts = list(candidates)
+            names = await asyncio.gather(
+                *(self._get_first_supply_name(account, candidates[account]) for account in accounts),
+                return_exceptions=True
+            )
+
+            for account, name in zip(accounts, names):
+                if isinstance(name, BaseException) or not name:
                     current_supply_names[account] = f"Финальная_поставка_{account}"
                     logger.warning(f"Не удалось получить название поставки для {account}, используем стандартное")
-        
+                else:
+                    current_supply_names[account] = name
+                    logger.info(f"Получено название текущей поставки для {account}: {name}")
+
         except Exception as e:
             logger.error(f"Ошибка получения текущих названий поставок: {str(e)}")
-        
+
         return current_supply_names
 
-    async def _create_new_final_supply(self, account: str, current_name: str) -> Optional[str]:
+    async def _create_new_final_supply(self, account: str, current_name: str,
+                                       db_lock: Optional[asyncio.Lock] = None) -> Optional[str]:
         """
         Создает новую финальную поставку в WB API и сохраняет в БД.
         
         Args:
             account: Аккаунт WB
             current_name: Текущее название для преобразования
+            db_lock: Блокировка соединения с БД при параллельной обработке аккаунтов
             
         Returns:
             str: ID созданной поставки или None при ошибке
         """
         try:
-            # Получаем токены
-            wb_tokens = get_wb_tokens()
-            if account not in wb_tokens:
+            supplies_api = self._get_supplies_client(account)
+            if supplies_api is None:
                 logger.error(f"Токен для аккаунта {account} не найден")
                 return None
             
@@ -182,7 +260,6 @@ class SuppliesService:
             final_name = self.convert_current_name_to_final(current_name)
             
             # Создаем поставку в WB API
-            supplies_api = Supplies(account, wb_tokens[account])
             result = await supplies_api.create_supply(final_name)
             
             if not result or 'id' not in result:
@@ -195,7 +272,11 @@ class SuppliesService:
             # Сохраняем в БД final_supplies
             if self.db:
                 final_supplies_db = FinalSupplies(self.db)
-                await final_supplies_db.save_final_supply(new_supply_id, account, final_name)
+                if db_lock:
+                    async with db_lock:
+                        await final_supplies_db.save_final_supply(new_supply_id, account, final_name)
+                else:
+                    await final_supplies_db.save_final_supply(new_supply_id, account, final_name)
             
             return new_supply_id
             
@@ -203,6 +284,43 @@ class SuppliesService:
             logger.error(f"Ошибка создания новой финальной поставки для {account}: {str(e)}")
             return None
 
+    async def _resolve_final_for_account(self, account: str, current_name: str,
+                                         final_supplies_db: FinalSupplies,
+                                         db_lock: asyncio.Lock) -> Optional[str]:
+        """
+        Возвращает активную финальную поставку аккаунта или создает новую.
+
+        Args:
+            account: Аккаунт WB
+            current_name: Текущее название поставки для формирования финального
+            final_supplies_db: Репозиторий финальных поставок
+            db_lock: Блокировка общего соединения с БД
+
+        Returns:
+            str: ID финальной поставки или None при ошибке создания
+        """
+        # Ищем последнюю активную финальную поставку
+        async with db_lock:
+            last_final_supply = await final_supplies_db.get_latest_final_supply(account)
+
+        if not last_final_supply:
+            # Нет существующих финальных поставок - создаем новую
+            logger.info(f"Нет финальных поставок для {account}, создаем первую")
+            return await self._create_new_final_supply(account, current_name, db_lock)
+
+        logger.info(f"Найдена существующая финальная поставка {last_final_supply['supply_id']} для {account}")
+
+        # Проверяем статус в WB API
+        wb_status = await self.get_supply_detailed_info(last_final_supply["supply_id"], account)
+
+        if wb_status and not wb_status.get("done", True):
+            # Поставка активна - используем её
+            logger.info(f"Используем активную финальную поставку {last_final_supply['supply_id']} для {account}")
+            return last_final_supply["supply_id"]
+
+        # Поставка неактивна - создаем новую
+        return await self._create_new_final_supply(account, current_name, db_lock)
+
     async def _create_or_use_final_supplies(
         self, 
         participating_combinations: Set[Tuple[str, str]], 
@@ -222,6 +340,9 @@ class SuppliesService:
         Returns:
             Dict[Tuple[str, str], str]: Маппинг комбинаций на supply_id
         """
+        # Статусы поставок могли измениться с прошлого вызова - не используем ранее полученные данные
+        self.supply_info_tasks.clear()
+
         # 1. Группируем по аккаунтам
         unique_accounts = {account for _, account in participating_combinations}
         logger.info(f"Обработка финальных поставок для аккаунтов: {unique_accounts}")
@@ -237,44 +358,30 @@ class SuppliesService:
         
         if self.db:
             final_supplies_db = FinalSupplies(self.db)
-            
-            for account in unique_accounts:
-                current_name = current_supply_names.get(account, f"Финальная_поставка_{account}")
-                
-                # Ищем последнюю активную финальную поставку
-                last_final_supply = await final_supplies_db.get_latest_final_supply(account)
-                
-                if last_final_supply:
-                    logger.info(f"Найдена существующая финальная поставка {last_final_supply['supply_id']} для {account}")
-                    
-                    # Проверяем статус в WB API
-                    wb_status = await self.get_supply_detailed_info(
-                        last_final_supply["supply_id"], 
-                        account
-                    )
-                    
-                    if wb_status and not wb_status.get("done", True):
-                        # Поставка активна - используем её
-                        account_final_supplies[account] = last_final_supply["supply_id"]
-                        logger.info(f"Используем активную финальную поставку {last_final_supply['supply_id']} для {account}")
-                    else:
-                        # Поставка неактивна - обновляем статус и создаем новую
-                        new_supply_id = await self._create_new_final_supply(account, current_name)
-                        if new_supply_id:
-                            account_final_supplies[account] = new_supply_id
-                else:
-                    # Нет существующих финальных поставок - создаем новую
-                    logger.info(f"Нет финальных поставок для {account}, создаем первую")
-                    new_supply_id = await self._create_new_final_supply(account, current_name)
-                    if new_supply_id:
-                        account_final_supplies[account] = new_supply_id
+            # Аккаунты обрабатываются параллельно, но соединение с БД одно - запросы к нему сериализуем
+            db_lock = asyncio.Lock()
+            accounts = list(unique_accounts)
+            results = await asyncio.gather(
+                *(self._resolve_final_for_account(
+                    account,
+                    current_supply_names.get(account, f"Финальная_поставка_{account}"),
+                    final_supplies_db,
+                    db_lock
+                ) for account in accounts),
+                return_exceptions=True
+            )
+
+            for account, supply_id in zip(accounts, results):
+                if isinstance(supply_id, BaseException):
+                    logger.error(f"Ошибка обработки финальной поставки для {account}: {supply_id}")
+                elif supply_id:
+                    account_final_supplies[account] = supply_id
         
         # 4. Формируем результат для всех комбинаций
-        new_supplies = {}
-        for wild_code, account in participating_combinations:
-            if account in account_final_supplies:
-                new_supplies[(wild_code, account)] = account_final_supplies[account]
-                logger.debug(f"Маппинг: ({wild_code}, {account}) -> {account_final_supplies[account]}")
+        new_supplies = {(wild_code, account): account_final_supplies[account]
+                        for wild_code, account in participating_combinations
+                        if account in account_final_supplies}
+        logger.debug("Маппинг комбинаций на финальные поставки: {}", new_supplies)
         
         logger.info(f"Финальные поставки подготовлены: {len(new_supplies)} комбинаций -> {len(account_final_supplies)} поставок")
         return new_supplies
@@ -282,6 +389,7 @@ class SuppliesService:
     @staticmethod
     def format_data_to_result(supply: SupplyId, order: StickerSchema, name_and_photo: Dict[int, Dict[str, Any]]) -> \
             Dict[str, Any]:
+        meta = name_and_photo.get(order.nm_id, DEFAULT_CARD_META)
         return {"order_id": order.order_id,
                 "account": supply.account,
                 "article": order.local_vendor_code,
@@ -290,9 +398,9 @@ class SuppliesService:
                 "file": order.file,
                 "partA": order.partA,
                 "partB": order.partB,
-                "category": name_and_photo.get(order.nm_id, {"category": "НЕТ Категории"})["category"],
-                "subject_name": name_and_photo.get(order.nm_id, {"subject_name": "НЕТ Наименования"})["subject_name"],
-                "photo_link": name_and_photo.get(order.nm_id, {"photo_link": "НЕТ ФОТО"})["photo_link"],
+                "category": meta["category"],
+                "subject_name": meta["subject_name"],
+                "photo_link": meta["photo_link"],
                 "createdAt": order.createdAt}
 
     @staticmethod
@@ -306,28 +414,38 @@ class SuppliesService:
                         item['subject_name'] = max_category
         return result
 
-    async def group_orders_to_wild(self, supply_ids: SupplyIdBodySchema) -> Dict[str, List[Dict[str, Any]]]:
+    async def _get_name_and_photo(self, nm_ids: Set[int]) -> Dict[int, Dict[str, Any]]:
+        """Получает наименование, категорию и фото товаров из card_data по nm_id."""
+        name_and_photo = await CardData(self.db).get_subject_name_category_and_photo_to_article(list(nm_ids))
+        return {data["article_id"]: {"subject_name": data["subject_name"], "photo_link": data["photo_link"],
+                                     "category": data["parent_name"]}
+                for data in name_and_photo}
+
+    async def group_orders_to_wild(self, supply_ids: SupplyIdBodySchema,
+                                   name_and_photo: Optional[Dict[int, Dict[str, Any]]] = None) -> Dict[
+        str, List[Dict[str, Any]]]:
         logger.info("Получение недостающих данных о заказе и группировка с сортировкой всех данных по wild")
-        result = {}
-        name_and_photo = await CardData(self.db).get_subject_name_category_and_photo_to_article(
-            [order.nm_id for orders in supply_ids.supplies for order in orders.orders])
-        name_and_photo: Dict[int, Dict[str, Any]] = \
-            {data["article_id"]: {"subject_name": data["subject_name"], "photo_link": data["photo_link"],
-                                  "category": data["parent_name"]}
-             for data in name_and_photo}
+        result = defaultdict(list)
+        if name_and_photo is None:
+            name_and_photo = await self._get_name_and_photo(
+                {order.nm_id for orders in supply_ids.supplies for order in orders.orders})
         order: StickerSchema
+        format_data = self.format_data_to_result
         for supply in supply_ids.supplies:
             for order in supply.orders:
-                if order.local_vendor_code not in result:
-                    result[order.local_vendor_code] = [self.format_data_to_result(supply, order, name_and_photo)]
-                else:
-                    result[order.local_vendor_code].append(self.format_data_to_result(supply, order, name_and_photo))
+                result[order.local_vendor_code].append(format_data(supply, order, name_and_photo))
         # self._change_category_name(result)
-        data = {k: sorted(v, key=lambda x: (x.get('createdAt', ''), x.get('id',
-                                                                          0)), reverse=True) for k, v in result.items()}
-        return dict(sorted(data.items(), key=lambda x: (min(item['subject_name']
-                                                            for item in x[1]), min(item.get('id', 0) for item in x[1]),
-                                                        x[0])))
+        # format_data_to_result всегда кладёт ключ createdAt и не кладёт id, поэтому ключ (createdAt, id)
+        # сводится к createdAt. Значение может быть None (дата не получена из WB) - приводим его к ''
+        data = {k: sorted(v, key=lambda x: x['createdAt'] or '', reverse=True) for k, v in result.items()}
+        # Ключ группы (минимальные subject_name и id) вычисляется один раз за проход по группе
+        decorated = []
+        for wild, items in data.items():
+            min_subject = min(item['subject_name'] for item in items)
+            min_id = min(item.get('id', 0) for item in items)
+            decorated.append((min_subject, min_id, wild, items))
+        decorated.sort(key=lambda x: x[:3])
+        return {wild: items for _, _, wild, items in decorated}
 
     @staticmethod
     async def get_information_to_supplies() -> List[Dict]:
@@ -350,40 +468,39 @@ class SuppliesService:
         if not basic_supplies_ids:
             return []
 
-        enriched_supplies = []
-        wb_tokens = get_wb_tokens()
-
+        tasks = []
+        meta = []
         for account_data in basic_supplies_ids:
             for account, supplies_list in account_data.items():
-                # Создаем задачи для параллельного получения информации о поставках
-                tasks = []
+                supplies_api = self._get_supplies_client(account)
+                if supplies_api is None:
+                    logger.error(f"Токен для аккаунта {account} не найден")
+                    continue
                 for supply_info in supplies_list:
                     if supply_id := supply_info.get('id'):
-                        supplies_api = Supplies(account, wb_tokens[account])
                         tasks.append(supplies_api.get_information_to_supply(supply_id))
+                        meta.append((account, supply_id))
 
-                if not tasks:
-                    continue
-
-                # Выполняем все запросы параллельно
-                wb_supplies_info = await asyncio.gather(*tasks)
+        if not tasks:
+            return []
 
-                # Обрабатываем результаты
-                account_supplies = []
-                for i, wb_supply_info in enumerate(wb_supplies_info):
-                    supply_id = supplies_list[i].get('id')
+        # Один gather на все аккаунты — запросы разных аккаунтов не ждут друг друга
+        wb_supplies_info = await asyncio.gather(*tasks, return_exceptions=True)
 
-                    if wb_supply_info and not wb_supply_info.get('errors'):
-                        enriched_supply = {
-                            'id': supply_id,
-                            'name': wb_supply_info.get('name', f'Supply_{supply_id}'),
-                            'createdAt': wb_supply_info.get('createdAt', ''),
-                            'done': wb_supply_info.get('done', False)
-                        }
-                        account_supplies.append(enriched_supply)
+        supplies_by_account = defaultdict(list)
+        for (account, supply_id), wb_supply_info in zip(meta, wb_supplies_info):
+            if isinstance(wb_supply_info, Exception):
+                logger.error(f"Ошибка получения информации о поставке {supply_id} ({account}): {wb_supply_info}")
+                continue
+            if wb_supply_info and not wb_supply_info.get('errors'):
+                supplies_by_account[account].append({
+                    'id': supply_id,
+                    'name': wb_supply_info.get('name', f'Supply_{supply_id}'),
+                    'createdAt': wb_supply_info.get('createdAt', ''),
+                    'done': wb_supply_info.get('done', False)
+                })
 
-                if account_supplies:
-                    enriched_supplies.append({account: account_supplies})
+        enriched_supplies = [{account: supplies} for account, supplies in supplies_by_account.items()]
 
         logger.info(f"Обогащено {len(enriched_supplies)} групп поставок информацией из WB API")
         return enriched_supplies
@@ -399,25 +516,16 @@ class SuppliesService:
         Returns:
             List[Dict]: Объединенные данные поставок
         """
-        merged_accounts = {}
-        for supplies_group in basic_supplies:
-            if isinstance(supplies_group, dict):
-                for account, supplies_list in supplies_group.items():
-                    if account not in merged_accounts:
-                        merged_accounts[account] = []
-                    merged_accounts[account].extend(supplies_list)
-
-        for supplies_group in fictitious_supplies:
+        merged_accounts = defaultdict(list)
+        for supplies_group in chain(basic_supplies, fictitious_supplies):
             if isinstance(supplies_group, dict):
                 for account, supplies_list in supplies_group.items():
-                    if account not in merged_accounts:
-                        merged_accounts[account] = []
                     merged_accounts[account].extend(supplies_list)
 
-        return [merged_accounts] if merged_accounts else []
+        return [dict(merged_accounts)] if merged_accounts else []
 
-    def _exclude_wb_active_from_db_supplies(self, db_supplies: List[Dict], wb_active_supplies: List[Dict]) -> List[
-        Dict]:
+    def _exclude_wb_active_from_db_supplies(self, db_supplies: List[Dict],
+                                            wb_active_supplies: List[Dict]) -> Dict[str, List[Dict]]:
         """
         Исключает из БД поставок те, которые есть среди активных WB поставок.
         
@@ -426,53 +534,42 @@ class SuppliesService:
             wb_active_supplies: Активные поставки из WB API (из get_information_to_supplies)
         
         Returns:
-            List[Dict]: Отфильтрованные поставки из БД (только те, которых нет в активных WB)
+            Dict[str, List[Dict]]: Отфильтрованные поставки из БД по аккаунтам {account: [supply, ...]}
+                (только те, которых нет в активных WB; аккаунты без поставок не включаются)
         """
         # Создаем множество активных поставок (supply_id, account)
-        wb_active_set = set()
-        for account_data in wb_active_supplies:
-            for account, supplies_list in account_data.items():
-                for supply in supplies_list:
-                    wb_active_set.add((supply['id'], account))
+        wb_active_set = {(supply['id'], account)
+                         for account_data in wb_active_supplies
+                         for account, supplies_list in account_data.items()
+                         for supply in supplies_list}
 
         logger.info(f"Найдено {len(wb_active_set)} активных поставок в WB API для исключения")
 
         # Фильтруем БД поставки
-        filtered_supplies = []
-        excluded_count = 0
-        total_count = 0
-
+        filtered_supplies = defaultdict(list)
         for account_data in db_supplies:
-            filtered_account_data = {}
             for account, supplies_list in account_data.items():
-                filtered_supplies_list = []
-                for supply in supplies_list:
-                    total_count += 1
-                    if (supply['id'], account) not in wb_active_set:
-                        filtered_supplies_list.append(supply)
-                    else:
-                        excluded_count += 1
-                        logger.debug(f"Исключена поставка {supply['id']} из аккаунта {account} (найдена в активных WB)")
-
-                if filtered_supplies_list:
-                    filtered_account_data[account] = filtered_supplies_list
+                if kept := [supply for supply in supplies_list if (supply['id'], account) not in wb_active_set]:
+                    filtered_supplies[account].extend(kept)
 
-            if filtered_account_data:
-                filtered_supplies.append(filtered_account_data)
+        total_count = sum(len(supplies_list) for account_data in db_supplies for supplies_list in account_data.values())
+        remaining_count = sum(len(supplies_list) for supplies_list in filtered_supplies.values())
+        logger.info(f"Обработано {total_count} поставок из БД, исключено {total_count - remaining_count}, "
+                    f"осталось {remaining_count} для дальнейшей обработки")
 
-        logger.info(f"Обработано {total_count} поставок из БД, исключено {excluded_count}, "
-                    f"осталось {total_count - excluded_count} для дальнейшей обработки")
+        return dict(filtered_supplies)
 
-        return filtered_supplies
-
-    @staticmethod
-    async def get_information_orders_to_supplies(supply_ids: List[dict]) -> List[Dict[str, Dict]]:
+    async def get_information_orders_to_supplies(self, supply_ids: List[dict]) -> List[Dict[str, Dict]]:
         logger.info(f'Получение информации о заказах по конкретным поставкам,количество поставок : {len(supply_ids)}')
         tasks = []
         for supplies in supply_ids:
             for account, supply in supplies.items():
+                client = self._get_supplies_client(account)
+                if client is None:
+                    logger.error(f"Токен для аккаунта {account} не найден")
+                    continue
                 for sup in supply:
-                    tasks.append(Supplies(account, get_wb_tokens()[account]).get_supply_orders(sup.get("id")))
+                    tasks.append(client.get_supply_orders(sup.get("id")))
         return await asyncio.gather(*tasks)
 
     @staticmethod
@@ -489,26 +586,27 @@ class SuppliesService:
 
     @staticmethod
     async def get_stickers(supplies_ids: SupplyIdBodySchema):
-        tasks = []
-        for supply in supplies_ids.supplies:
-            tasks.append(
-                Orders(supply.account, settings.tokens[supply.account]).get_stickers_to_orders(supply.supply_id,
-                                                                                               [v.order_id for v in
-                                                                                                supply.orders]))
-        return await asyncio.gather(*tasks)
+        semaphore = asyncio.Semaphore(STICKERS_CONCURRENCY)
+        tokens = get_wb_tokens()
+
+        async def fetch(supply):
+            async with semaphore:
+                return await Orders(supply.account, tokens[supply.account]).get_stickers_to_orders(
+                    supply.supply_id, [v.order_id for v in supply.orders])
+
+        return await asyncio.gather(*(fetch(supply) for supply in supplies_ids.supplies))
 
     @staticmethod
     def union_results_stickers(supply_orders: SupplyIdBodySchema, stickers: Dict[str, Dict]):
         logger.info("Формирование данных c полученными qr кодами в общий словарь")
         for supply in supply_orders.supplies:
-            orders: List[OrderSchema] = sorted(supply.orders, key=lambda x: x.order_id)
-            sticker: List[Dict[str, Any]] = sorted(stickers[supply.account][supply.supply_id]['stickers'],
-                                                   key=lambda x: x['orderId'])
-            for n, v in enumerate(orders):
-                if v.order_id == sticker[n].get('orderId'):
-                    order_dict: Dict[str, Any] = v.dict()
-                    combined_data: Dict[str, Any] = {**order_dict, **sticker[n]}
-                    supply.orders[n]: List[StickerSchema] = StickerSchema(**combined_data)
+            sticker_by_id: Dict[int, Dict[str, Any]] = {
+                s['orderId']: s for s in stickers[supply.account][supply.supply_id]['stickers']}
+            for n, v in enumerate(supply.orders):
+                sticker = sticker_by_id.get(v.order_id)
+                if sticker is not None:
+                    combined_data: Dict[str, Any] = {**v.dict(), **sticker}
+                    supply.orders[n] = StickerSchema(**combined_data)
 
     @staticmethod
     def create_supply_result(supply: Dict[str, Dict[str, Any]], supply_id: str, account: str,
@@ -538,42 +636,38 @@ class SuppliesService:
         Returns:
             List: Отфильтрованный список поставок
         """
-        hanging_supplies_list = await HangingSupplies(self.db).get_hanging_supplies()
+        hanging_supplies_list = await HangingSupplies(self.db).get_hanging_supplies_cached()
         hanging_supplies_map = {(hs['supply_id'], hs['account']): hs for hs in hanging_supplies_list}
 
         # ========================================
         # НОВОЕ: Получаем статусы заказов из assembly_task_status
         # ========================================
-        if hanging_only:
+        supply_orders_map = {}  # {(supply_id, account): [order_ids]}
+        statuses_cache = {}  # {account: {order_id: {'wb_status': '...', 'supplier_status': '...'}}}
+        # Без висячих поставок в БД ни одна поставка не пройдет фильтр - статусы не нужны
+        if hanging_only and hanging_supplies_map:
             # Собираем все order_id для висячих поставок, группируем по аккаунтам
             orders_by_account = defaultdict(set)  # {account: {order_id1, order_id2, ...}}
-            supply_orders_map = {}  # {(supply_id, account): [order_ids]}
 
             for supply in supplies_data:
                 key = (supply['supply_id'], supply['account'])
                 if key in hanging_supplies_map:
-                    order_ids = [
-                        order['order_id'] if isinstance(order, dict) else order.order_id
-                        for order in supply.get('orders', [])
-                    ]
+                    # Заказы одной поставки однотипны (dict или OrderSchema) - тип проверяем один раз
+                    orders = supply.get('orders', [])
+                    if orders and isinstance(orders[0], dict):
+                        order_ids = [order['order_id'] for order in orders]
+                    else:
+                        order_ids = [order.order_id for order in orders]
                     supply_orders_map[key] = order_ids
                     orders_by_account[supply['account']].update(order_ids)
 
-            # Получаем статусы батчем для каждого аккаунта
-            statuses_cache = {}  # {account: {order_id: {'wb_status': '...', 'supplier_status': '...'}}}
-            assembly_task_status_service = AssemblyTaskStatus(self.db)
-
-            for account, order_ids_set in orders_by_account.items():
-                if order_ids_set:
-                    order_ids_list = list(order_ids_set)
-                    statuses = await assembly_task_status_service.get_order_statuses_batch(account, order_ids_list)
-                    statuses_cache[account] = statuses
-                    logger.info(
-                        f"Получено {len(statuses)} статусов для аккаунта {account} "
-                        f"из {len(order_ids_list)} запрошенных заказов"
-                    )
+            # Получаем статусы всех аккаунтов одним запросом: соединение с БД одно,
+            # параллельные запросы по аккаунтам на нем невозможны
+            # Если ни одна поставка из supplies_data не висячая - в БД не ходим
+            if orders_by_account:
+                statuses_cache = await AssemblyTaskStatus(self.db).get_order_statuses_by_accounts(orders_by_account)
 
-        target_wilds = {}
+        target_wilds = frozenset()
         filtered_supplies = []
 
         for supply in supplies_data:
@@ -586,24 +680,11 @@ class SuppliesService:
 
                     # Добавляем количество отгруженных товаров
                     hanging_supply_data = hanging_supplies_map[key]
-                    fictitious_shipped_order_ids = hanging_supply_data.get('fictitious_shipped_order_ids', [])
-
-                    # Десериализуем fictitious_shipped_order_ids если это строка JSON
-                    if isinstance(fictitious_shipped_order_ids, str):
-                        try:
-                            fictitious_shipped_order_ids = json.loads(fictitious_shipped_order_ids)
-                        except json.JSONDecodeError:
-                            fictitious_shipped_order_ids = []
-
-                    if fictitious_shipped_order_ids and isinstance(fictitious_shipped_order_ids, list):
-                        # Подсчитываем уникальные ID заказов
-                        unique_shipped_ids = set(
-                            order.get('order_id') for order in fictitious_shipped_order_ids
-                            if isinstance(order, dict) and order.get('order_id')
-                        )
-                        supply["shipped_count"] = len(unique_shipped_ids)
-                    else:
-                        supply["shipped_count"] = 0
+                    # Уникальные ID фиктивно отгруженных заказов: JSON разбирается только для поставок,
+                    # прошедших фильтр. Строки кэша не дополняем - HangingSupplies отдает их копии
+                    unique_shipped_ids = self._get_shipped_order_ids(
+                        hanging_supply_data.get('fictitious_shipped_order_ids', []))
+                    supply["shipped_count"] = len(unique_shipped_ids)
 
                     # Добавляем информацию о фиктивной доставке
                     is_fictitious_delivered = hanging_supply_data.get('is_fictitious_delivered', False)
@@ -614,8 +695,9 @@ class SuppliesService:
                     # ========================================
                     if is_fictitious_delivered:
                         # Поставка в статусе доставки - применяем строгую валидацию
-                        blocked_order_ids = []  # Все невалидные заказы
-                        valid_order_ids = []    # Валидные заказы (для подсчета)
+                        # Множества собираются сразу, без промежуточных списков
+                        blocked_order_ids_set = set()  # Все невалидные заказы
+                        valid_order_ids_set = set()    # Валидные заказы (для подсчета)
                         order_ids = supply_orders_map.get(key, [])
                         account_statuses = statuses_cache.get(supply['account'], {})
 
@@ -630,27 +712,21 @@ class SuppliesService:
                             )
 
                             if not is_valid_for_delivery:
-                                blocked_order_ids.append(order_id)
+                                blocked_order_ids_set.add(order_id)
                             else:
-                                valid_order_ids.append(order_id)
+                                valid_order_ids_set.add(order_id)
 
-                        # Получаем все множества заказов
-                        all_order_ids = set(order_ids)
-                        blocked_order_ids_set = set(blocked_order_ids)
-                        valid_order_ids_set = set(valid_order_ids)
-                        shipped_order_ids_set = unique_shipped_ids  # Уже вычислено выше (строка 603-606)
+                        shipped_order_ids_set = unique_shipped_ids  # Те же ID, что посчитаны для shipped_count
 
                         # Для фронтенда показываем только невалидные заказы, которые НЕ были отгружены
                         # Это исключает заказы, которые были отгружены валидными, а потом изменили статус
                         truly_blocked_order_ids = blocked_order_ids_set - shipped_order_ids_set
                         supply["canceled_order_ids"] = list(truly_blocked_order_ids)
 
-                        # Вычисляем ДОСТУПНЫЕ для отгрузки заказы
-                        # Доступные = Валидные по статусу СЕЙЧАС - УЖЕ отгруженные
-                        available_order_ids = valid_order_ids_set - shipped_order_ids_set
-
-                        # ПОСТАВКА СКРЫВАЕТСЯ только если НЕТ доступных заказов
-                        should_hide = len(available_order_ids) == 0
+                        # ДОСТУПНЫЕ для отгрузки заказы = Валидные по статусу СЕЙЧАС - УЖЕ отгруженные.
+                        # ПОСТАВКА СКРЫВАЕТСЯ только если НЕТ доступных заказов, т.е. все валидные уже отгружены -
+                        # проверяем вложение множеств, не строя разность
+                        should_hide = valid_order_ids_set <= shipped_order_ids_set
 
                         if should_hide:
                             # Определяем причину для детального логирования
@@ -663,24 +739,21 @@ class SuppliesService:
 
                             logger.info(
                                 f"Скрываем поставку в доставке {supply['supply_id']} (аккаунт {supply['account']}): "
-                                f"total={len(all_order_ids)}, valid={len(valid_order_ids_set)}, "
+                                f"total={len(set(order_ids))}, valid={len(valid_order_ids_set)}, "
                                 f"blocked={len(blocked_order_ids_set)}, shipped={len(shipped_order_ids_set)}, "
-                                f"available={len(available_order_ids)} (причина: {reason})"
+                                f"available=0 (причина: {reason})"
                             )
                             continue  # Не добавляем в результат - скрываем поставку!
                     else:
                         # Активная висячая поставка (НЕ в доставке) - старая логика
-                        canceled_order_ids = []
                         order_ids = supply_orders_map.get(key, [])
                         account_statuses = statuses_cache.get(supply['account'], {})
 
-                        for order_id in order_ids:
-                            status_data = account_statuses.get(order_id, {})
-                            wb_status = status_data.get('wb_status')
-
-                            # Блокируем только canceled и canceled_by_client (старая логика)
-                            if wb_status in ['canceled', 'canceled_by_client']:
-                                canceled_order_ids.append(order_id)
+                        # Блокируем только canceled и canceled_by_client (старая логика)
+                        canceled_order_ids = [
+                            order_id for order_id in order_ids
+                            if account_statuses.get(order_id, {}).get('wb_status') in CANCELED_WB_STATUSES
+                        ]
 
                         supply["canceled_order_ids"] = canceled_order_ids
 
@@ -700,11 +773,15 @@ class SuppliesService:
                             )
                             continue  # Не добавляем в результат - скрываем поставку!
 
-                    # Проверка на target_wilds (оставляем без изменений)
-                    has_target_wild = any(
-                        (order.local_vendor_code if hasattr(order, 'local_vendor_code') else order.get('local_vendor_code')) in target_wilds
-                        for order in supply.get('orders', [])
-                    )
+                    # Проверка на target_wilds: при пустом наборе обход заказов не нужен.
+                    # Заказы одной поставки однотипны (dict или OrderSchema) - тип проверяем один раз
+                    has_target_wild = False
+                    orders = supply.get('orders', [])
+                    if target_wilds and orders:
+                        if isinstance(orders[0], dict):
+                            has_target_wild = any(order.get('local_vendor_code') in target_wilds for order in orders)
+                        else:
+                            has_target_wild = any(order.local_vendor_code in target_wilds for order in orders)
                     if not has_target_wild:
                         filtered_supplies.append(supply)
                 else:
@@ -730,15 +807,16 @@ class SuppliesService:
             return supplies_data
 
         # ============ Шаг 1: Собираем все order_ids ============
+        # Извлекаем order_id (поддержка dict и Pydantic модели): заказы одной поставки однотипны,
+        # поэтому тип проверяем один раз на поставку
+        supplies_order_ids = []  # [(orders, [order_id, ...], is_dict)] в порядке supplies_data
         all_order_ids = []
-        order_supply_map = {}  # {order_id: (supply_index, order_index)}
-
-        for supply_idx, supply in enumerate(supplies_data):
-            for order_idx, order in enumerate(supply.get('orders', [])):
-                # Извлекаем order_id (поддержка dict и Pydantic модели)
-                order_id = order['order_id'] if isinstance(order, dict) else order.order_id
-                all_order_ids.append(order_id)
-                order_supply_map[order_id] = (supply_idx, order_idx)
+        for supply in supplies_data:
+            orders = supply.get('orders', [])
+            is_dict = bool(orders) and isinstance(orders[0], dict)
+            order_ids = [order['order_id'] for order in orders] if is_dict else [order.order_id for order in orders]
+            supplies_order_ids.append((orders, order_ids, is_dict))
+            all_order_ids.extend(order_ids)
 
         if not all_order_ids:
             logger.debug("Нет заказов для обогащения QR-кодами")
@@ -747,26 +825,33 @@ class SuppliesService:
         # ============ Шаг 2: Получаем QR-коды batch-запросом ============
         qr_scan_db = QRScanDB(self.db)
 
-        logger.debug(f"Получение QR-кодов для {len(all_order_ids)} заказов")
-        qr_codes = await qr_scan_db.get_qr_codes_by_order_ids(all_order_ids)
-
-        # ============ Шаг 3: Обогащаем заказы QR-кодами ============
+        logger.debug("Получение QR-кодов для {} заказов", len(all_order_ids))
+        # Пачками ограниченного размера, чтобы массив в ANY($1) не разрастался. Пачки идут
+        # последовательно: соединение с БД одно, параллельные запросы на нем невозможны
+        qr_codes = {}
+        for start in range(0, len(all_order_ids), QR_CODES_BATCH_SIZE):
+            batch = all_order_ids[start:start + QR_CODES_BATCH_SIZE]
+            batch_started = time.perf_counter()
+            qr_codes.update(await qr_scan_db.get_qr_codes_by_order_ids(batch))
+            logger.debug("Пачка QR-кодов {}-{} получена за {:.3f} с",
+                         start, start + len(batch), time.perf_counter() - batch_started)
+
+        # ============ Шаг 3: Обогащаем заказы QR-кодами за один проход ============
         enriched_count = 0
 
-        for order_id, qr_code in qr_codes.items():
-            if order_id not in order_supply_map:
-                continue
-
-            supply_idx, order_idx = order_supply_map[order_id]
-            order = supplies_data[supply_idx]['orders'][order_idx]
+        for orders, order_ids, is_dict in supplies_order_ids:
+            for order, order_id in zip(orders, order_ids):
+                qr_code = qr_codes.get(order_id)
+                if qr_code is None:
+                    continue
 
-            # Устанавливаем QR-код (поддержка dict и Pydantic модели)
-            if isinstance(order, dict):
-                order['qr_code'] = qr_code
-            else:
-                order.qr_code = qr_code
+                # Устанавливаем QR-код (поддержка dict и Pydantic модели)
+                if is_dict:
+                    order['qr_code'] = qr_code
+                else:
+                    order.qr_code = qr_code
 
-            enriched_count += 1
+                enriched_count += 1
 
         logger.info(
             f"Обогащено {enriched_count} заказов QR-кодами из {len(all_order_ids)} общих "
@@ -776,23 +861,24 @@ class SuppliesService:
         return supplies_data
 
     @staticmethod
-    def _is_supply_empty(hanging_supply: Dict) -> bool:
+    def _is_supply_empty(hanging_supply: Dict) -> Tuple[bool, int]:
         """
         Проверяет, является ли поставка пустой (нет заказов).
+        Количество заказов возвращается вместе с результатом, чтобы не разбирать JSON повторно.
 
         Args:
             hanging_supply: Запись висячей поставки из БД
 
         Returns:
-            bool: True если поставка пустая, False если есть заказы
+            Tuple[bool, int]: (поставка_пустая, количество_заказов)
         """
         try:
             order_data = hanging_supply.get('order_data', {})
             if isinstance(order_data, str):
-                order_data = json.loads(order_data)
+                order_data = orjson.loads(order_data)
 
-            orders = order_data.get('orders', [])
-            return len(orders) == 0
+            orders_count = len(order_data.get('orders', []))
+            return orders_count == 0, orders_count
 
         except Exception as e:
             logger.error(
@@ -800,13 +886,13 @@ class SuppliesService:
                 f"{hanging_supply.get('supply_id')}: {e}"
             )
             # В случае ошибки парсинга считаем поставку пустой (безопаснее)
-            return True
+            return True, 0
 
     def _should_mark_supply_as_fictitious(
         self,
         hanging_supply: Dict,
         active_supply_ids: Set[Tuple[str, str]]
-    ) -> Tuple[bool, Optional[str]]:
+    ) -> Tuple[bool, Optional[str], int]:
         """
         Проверяет, нужно ли пометить поставку как фиктивную.
 
@@ -815,25 +901,26 @@ class SuppliesService:
             active_supply_ids: Множество (supply_id, account) поставок в статусе сборки (done=False)
 
         Returns:
-            Tuple[bool, Optional[str]]: (нужно_пометить, причина_пропуска)
+            Tuple[bool, Optional[str], int]: (нужно_пометить, причина_пропуска, количество_заказов)
         """
         supply_id = hanging_supply['supply_id']
         account = hanging_supply['account']
 
         # ПРОВЕРКА 1: Поставка еще в сборке (done=False в WB)
         if (supply_id, account) in active_supply_ids:
-            return False, "active_in_wb"
+            return False, "active_in_wb", 0
 
         # ПРОВЕРКА 2: Уже помечена фиктивной
         if hanging_supply.get('is_fictitious_delivered', False):
-            return False, "already_marked"
+            return False, "already_marked", 0
 
         # ПРОВЕРКА 3: Поставка пустая (нет заказов)
-        if self._is_supply_empty(hanging_supply):
-            return False, "empty_supply"
+        is_empty, orders_count = self._is_supply_empty(hanging_supply)
+        if is_empty:
+            return False, "empty_supply", 0
 
         # Все проверки пройдены: поставка перешла в доставку (done=True)
-        return True, None
+        return True, None, orders_count
 
     async def _auto_mark_done_supplies_as_fictitious(
         self,
@@ -843,7 +930,7 @@ class SuppliesService:
         Автоматически помечает висячие поставки как фиктивные, если они перешли в доставку (done=True).
 
         Логика:
-        1. Получает все висячие поставки из БД
+        1. Получает все висячие поставки (из короткоживущего кэша HangingSupplies)
         2. Сравнивает с поставками в сборке из WB API (done=False)
         3. Поставки из БД, которых нет в списке сборки → перешли в доставку → помечает как фиктивные
 
@@ -854,7 +941,8 @@ class SuppliesService:
         Защита от ошибок:
         - Пропускает пустые поставки (будут обработаны EmptySupplyCleaner)
         - Пропускает уже помеченные фиктивные
-        - Обрабатывает ошибки для каждой поставки независимо
+        - Помечает все поставки одним UPDATE: при ошибке БД не помечается ни одна,
+          они будут помечены при следующем вызове
 
         Args:
             active_supplies_result: Список поставок в статусе сборки (done=False) из WB API
@@ -863,7 +951,9 @@ class SuppliesService:
             Tuple[int, int]: (количество_помеченных, количество_пропущенных_пустых)
         """
         hanging_supplies_model = HangingSupplies(self.db)
-        all_hanging = await hanging_supplies_model.get_hanging_supplies()
+        # Кэшированный список: тот же, что затем читает filter_supplies_by_hanging в этом же запросе.
+        # Если что-то будет помечено, mark_many_as_fictitious_delivered сбросит кэш
+        all_hanging = await hanging_supplies_model.get_hanging_supplies_cached()
 
         # Множество поставок в статусе сборки (done=False) из WB API
         active_supply_ids = {
@@ -871,43 +961,41 @@ class SuppliesService:
             for supply in active_supplies_result
         }
 
-        marked_count = 0
         skipped_empty = 0
+        to_mark = {}  # {(supply_id, account): количество заказов для логирования}
 
         for hanging in all_hanging:
             supply_id = hanging['supply_id']
             account = hanging['account']
 
             # Проверяем все условия для пометки
-            should_mark, skip_reason = self._should_mark_supply_as_fictitious(
+            should_mark, skip_reason, orders_count = self._should_mark_supply_as_fictitious(
                 hanging, active_supply_ids
             )
 
             if not should_mark:
                 if skip_reason == "empty_supply":
-                    logger.debug(f"⏭️ Пропускаем пустую поставку {supply_id} ({account})")
+                    logger.debug("⏭️ Пропускаем пустую поставку {} ({})", supply_id, account)
                     skipped_empty += 1
                 continue
 
             # ВСЕ ПРОВЕРКИ ПРОЙДЕНЫ: Поставка перешла в доставку, помечаем фиктивной
-            try:
-                # Получаем количество заказов для логирования
-                order_data = hanging.get('order_data', {})
-                if isinstance(order_data, str):
-                    order_data = json.loads(order_data)
-                orders_count = len(order_data.get('orders', []))
-
-                await hanging_supplies_model.mark_as_fictitious_delivered(
-                    supply_id, account, operator='auto_system'
-                )
-                logger.info(
-                    f"🔔 Поставка {supply_id} ({account}) помечена как фиктивная "
-                    f"(перешла в доставку done=True, {orders_count} заказов)"
-                )
-                marked_count += 1
+            to_mark[(supply_id, account)] = orders_count
 
-            except Exception as e:
-                logger.error(f"Ошибка пометки {supply_id}: {e}")
+        # Одним UPDATE на все поставки вместо запроса на каждую
+        marked = await hanging_supplies_model.mark_many_as_fictitious_delivered(
+            list(to_mark), operator='auto_system'
+        )
+        if to_mark and not marked:
+            logger.error(
+                f"Ни одна из {len(to_mark)} поставок, перешедших в доставку, не помечена как фиктивная"
+            )
+        for supply_id, account in marked:
+            logger.info(
+                f"🔔 Поставка {supply_id} ({account}) помечена как фиктивная "
+                f"(перешла в доставку done=True, {to_mark[(supply_id, account)]} заказов)"
+            )
+        marked_count = len(marked)
 
         return marked_count, skipped_empty
 
@@ -944,11 +1032,9 @@ class SuppliesService:
             )
 
             # 2. Формируем список запрашиваемых поставок
-            requested_supplies = []
-            for account_data in filtered_supplies_ids:
-                for account, supplies_list in account_data.items():
-                    for supply in supplies_list:
-                        requested_supplies.append((supply['id'], account))
+            requested_supplies = [(supply['id'], account)
+                                  for account, supplies_list in filtered_supplies_ids.items()
+                                  for supply in supplies_list]
 
             logger.info(f"Запрошено {len(requested_supplies)} доставленных поставок")
 
@@ -964,10 +1050,8 @@ class SuppliesService:
                 logger.info(f"Получение {len(missing_supplies)} недостающих поставок из WB API")
 
                 # Формируем структуру для WB API
-                missing_by_account = {}
+                missing_by_account = defaultdict(list)
                 for supply_id, account in missing_supplies:
-                    if account not in missing_by_account:
-                        missing_by_account[account] = []
                     missing_by_account[account].append({'id': supply_id})
 
                 missing_formatted = [{acc: sups} for acc, sups in missing_by_account.items()]
@@ -978,16 +1062,18 @@ class SuppliesService:
 
                 # Формируем result для недостающих (используем существующую логику)
                 missing_result = []
-                enriched_dict = {key: val for d in enriched_supplies for key, val in d.items()}
+                # Метаданные поставок строятся один раз на аккаунт, а не для каждой supply_id.
+                # missing_orders содержит отдельный элемент на каждую поставку, поэтому строим их заранее
+                supply_meta_by_account = {
+                    account: {data["id"]: {"name": data["name"], "createdAt": data['createdAt']}
+                              for data in supplies_list}
+                    for d in enriched_supplies for account, supplies_list in d.items()
+                }
 
                 for order_data in missing_orders:
                     for account, supply_orders in order_data.items():
+                        supply_meta = supply_meta_by_account.get(account, {})
                         for supply_id, orders in supply_orders.items():
-                            supply_meta = {
-                                data["id"]: {"name": data["name"], "createdAt": data['createdAt']}
-                                for data in enriched_dict.get(account, [])
-                            }
-
                             if supply_id in supply_meta:
                                 supply_obj = self.create_supply_result(
                                     supply_meta,
@@ -1030,24 +1116,23 @@ class SuppliesService:
             supplies_ids_dict = {key: value for d in supplies_ids for key, value in d.items()}
 
             for account, value in supplies.items():
+                # Метаданные поставок аккаунта строятся один раз, а не для каждой supply_id
+                supply_meta = {
+                    data["id"]: {"name": data["name"], "createdAt": data['createdAt']}
+                    for data in supplies_ids_dict[account] if not data['done']
+                }
                 for supply_id, orders in value.items():
-                    supply = {
-                        data["id"]: {"name": data["name"], "createdAt": data['createdAt']}
-                        for data in supplies_ids_dict[account] if not data['done']
-                    }
-                    result.append(self.create_supply_result(supply, supply_id, account, orders))
+                    result.append(self.create_supply_result(supply_meta, supply_id, account, orders))
 
         # Автоматическая пометка висячих поставок с done=True как фиктивных
         if hanging_only and not is_delivery:
             # Формируем список ТОЛЬКО активных поставок (done=False) для корректной пометки
-            active_supplies_only_false = []
-            for account, supplies_list in supplies_ids_dict.items():
-                for supply_data in supplies_list:
-                    if not supply_data['done']:  # Только done=False
-                        active_supplies_only_false.append({
-                            'supply_id': supply_data['id'],
-                            'account': account
-                        })
+            active_supplies_only_false = [
+                {'supply_id': supply_data['id'], 'account': account}
+                for account, supplies_list in supplies_ids_dict.items()
+                for supply_data in supplies_list
+                if not supply_data['done']  # Только done=False
+            ]
 
             marked_count, skipped_empty = await self._auto_mark_done_supplies_as_fictitious(active_supplies_only_false)
             if marked_count > 0 or skipped_empty > 0:
@@ -1091,15 +1176,13 @@ class SuppliesService:
                 all_db_supplies_ids, wb_active_supplies_ids)
 
             # Извлекаем только supply_id (без запроса полных данных заказов)
-            supply_ids_set = set()
-            for account_data in filtered_supplies_ids:
-                for account, supplies_list in account_data.items():
-                    for supply_data in supplies_list:
-                        supply_ids_set.add(supply_data['id'])
+            supply_ids_set = {supply_data['id']
+                              for supplies_list in filtered_supplies_ids.values()
+                              for supply_data in supplies_list}
 
             # Получаем висячие supply_id из БД
             hanging_supplies_model = HangingSupplies(self.db)
-            hanging_supply_ids_data = await hanging_supplies_model.get_hanging_supplies()
+            hanging_supply_ids_data = await hanging_supplies_model.get_hanging_supplies_cached()
             hanging_supply_ids = {item['supply_id'] for item in hanging_supply_ids_data}
             # Применяем фильтр hanging_only если нужно
             if hanging_only:
@@ -1116,13 +1199,17 @@ class SuppliesService:
 
     async def check_current_orders(self, supply_ids: SupplyIdBodySchema, allow_partial: bool = False):
         logger.info("Проверка поставок на соответствие наличия заказов (сверка заказов по поставкам)")
-        tasks: List = [
-            Supplies(
-                supply.account, get_wb_tokens()[supply.account]
-            ).get_supply_orders(supply.supply_id)
-            for supply in supply_ids.supplies
-        ]
-        result: Dict[str, Dict] = self.group_result(await asyncio.gather(*tasks))
+        semaphore = asyncio.Semaphore(SUPPLY_ORDERS_CONCURRENCY)
+        for account in {supply.account for supply in supply_ids.supplies}:
+            if self._get_supplies_client(account) is None:
+                raise HTTPException(status_code=404, detail=f"Токен для аккаунта {account} не найден")
+
+        async def fetch(supply):
+            async with semaphore:
+                return await self._get_supplies_client(supply.account).get_supply_orders(supply.supply_id)
+
+        result: Dict[str, Dict] = self.group_result(
+            await asyncio.gather(*(fetch(supply) for supply in supply_ids.supplies)))
         self._enrich_orders_with_created_at(supply_ids, result)
 
         for supply in supply_ids.supplies:
@@ -1154,12 +1241,17 @@ class SuppliesService:
             supply_ids: Схема с поставками и заказами для обогащения
             wb_result: Результат от WB API с полными данными заказов
         """
+        # Даты нужны только заказам без createdAt - остальные из ответа WB не сохраняем
+        needed = {order.order_id for supply in supply_ids.supplies for order in supply.orders if not order.createdAt}
+        if not needed:
+            return
+
         order_dates = {
             order['id']: order['createdAt']
             for account_data in wb_result.values()
             for supply_data in account_data.values()
             for order in supply_data.get('orders', [])
-            if order.get('id') and order.get('createdAt')
+            if order.get('id') in needed and order.get('createdAt')
         }
 
         enriched_count = 0
@@ -1174,10 +1266,17 @@ class SuppliesService:
 
     async def filter_and_fetch_stickers(self, supply_ids: SupplyIdBodySchema, allow_partial: bool = False) -> Dict[str, List[Dict[str, Any]]]:
         logger.info('Инициализация получение документов (Стикеры и Лист подбора)')
-        await self.check_current_orders(supply_ids, allow_partial)
-        stickers: Dict[str, Dict] = self.group_result(await self.get_stickers(supply_ids))
-        self.union_results_stickers(supply_ids, stickers)
-        return await self.group_orders_to_wild(supply_ids)
+        # Данные карточек зависят только от nm_id из запроса: загружаем их параллельно со сверкой и стикерами
+        name_and_photo_task = asyncio.create_task(self._get_name_and_photo(
+            {order.nm_id for supply in supply_ids.supplies for order in supply.orders}))
+        try:
+            await self.check_current_orders(supply_ids, allow_partial)
+            stickers: Dict[str, Dict] = self.group_result(await self.get_stickers(supply_ids))
+            self.union_results_stickers(supply_ids, stickers)
+            return await self.group_orders_to_wild(supply_ids, await name_and_photo_task)
+        finally:
+            if not name_and_photo_task.done():
+                name_and_photo_task.cancel()
 
     @staticmethod
     async def delete_single_supply(account: str, supply_id: str, token: str) -> Optional[SupplyDeleteItem]:
@@ -1195,16 +1294,26 @@ class SuppliesService:
             return
 
     async def delete_supplies(self, body: SupplyDeleteBody) -> SupplyDeleteResponse:
-        """Удаляет несколько поставок и возвращает список успешно удалённых"""
+        """
+        Удаляет несколько поставок и возвращает список успешно удалённых.
+        WB API не поддерживает пакетное удаление, поэтому поставки удаляются параллельно,
+        не более DELETE_SUPPLIES_CONCURRENCY одновременно.
+        """
         logger.info(f"Удаление поставок: {body.supply}")
         tokens = get_wb_tokens()
-        tasks = []
-        for item in body.supply:
-            token = tokens.get(item.account)
-            tasks.append(self.delete_single_supply(item.account, item.supply_id, token))
+        semaphore = asyncio.Semaphore(DELETE_SUPPLIES_CONCURRENCY)
+
+        async def delete(item):
+            async with semaphore:
+                return await self.delete_single_supply(item.account, item.supply_id, tokens.get(item.account))
 
-        results = await asyncio.gather(*tasks)
-        deleted_ids = [item for item in results if item is not None]
+        results = await asyncio.gather(*(delete(item) for item in body.supply), return_exceptions=True)
+        deleted_ids = []
+        for item, res in zip(body.supply, results):
+            if isinstance(res, BaseException):
+                logger.error(f"Ошибка при удалении {item.supply_id} для {item.account}: {res}")
+            elif res is not None:
+                deleted_ids.append(res)
 
         return SupplyDeleteResponse(deleted=deleted_ids)
 
@@ -1221,19 +1330,26 @@ class SuppliesService:
 
         supplies_list = []
 
+        # Одна поставка может встречаться в запросе несколько раз: объединяем заказы по (account, supply_id),
+        # чтобы запросить детали каждой поставки один раз, и запрашиваем их параллельно
+        order_ids_by_supply: Dict[Tuple[str, str], Set[int]] = {}
         for supply_item in wild_filter.supplies:
-            orders_details = await self._get_orders_details(
-                supply_item.account,
-                supply_item.supply_id,
-                [order.order_id for order in supply_item.orders]
-            )
+            order_ids_by_supply.setdefault((supply_item.account, supply_item.supply_id), set()).update(
+                order.order_id for order in supply_item.orders)
+
+        details_list = await asyncio.gather(*[
+            self._get_orders_details(account, supply_id, list(order_ids))
+            for (account, supply_id), order_ids in order_ids_by_supply.items()
+        ])
+        details_by_supply = dict(zip(order_ids_by_supply, details_list))
 
-            orders_list = []
-            orders_list.extend(
+        for supply_item in wild_filter.supplies:
+            orders_details = details_by_supply[(supply_item.account, supply_item.supply_id)]
+            wanted_ids = {order.order_id for order in supply_item.orders}
+            orders_list = [
                 OrderSchema(order_id=order_detail.get('id'), nm_id=order_detail.get('nmId'),
                             local_vendor_code=wild_filter.wild, createdAt=order_detail.get('createdAt'))
-                for order_detail in orders_details if order_detail.get('id') in [order.order_id
-                                                                                 for order in supply_item.orders])
+                for order_detail in orders_details if order_detail.get('id') in wanted_ids]
             if not orders_list:
                 continue
 
@@ -1275,7 +1391,10 @@ class SuppliesService:
             List[Dict[str, Any]]: Список с деталями заказов
         """
         try:
-            supply = Supplies(account, get_wb_tokens()[account])
+            supply = self._get_supplies_client(account)
+            if supply is None:
+                logger.error(f"Токен для аккаунта {account} не найден")
+                return []
             supply_data = await supply.get_supply_orders(supply_id)
 
             if not supply_data or account not in supply_data or supply_id not in supply_data[account]:
@@ -1284,7 +1403,8 @@ class SuppliesService:
 
             all_orders = supply_data[account][supply_id].get("orders", [])
 
-            filtered_orders = [order for order in all_orders if order.get("id") in order_ids]
+            wanted_ids = set(order_ids)
+            filtered_orders = [order for order in all_orders if order.get("id") in wanted_ids]
 
             return filtered_orders
         except Exception as e:
@@ -1596,17 +1716,21 @@ class SuppliesService:
         logger.info(f"Подготовка данных для записи в таблицу shipment_of_goods: {len(supply_ids)} поставок")
 
         result = []
+        # Поля, общие для всех записей вызова; дата считается один раз
+        base_data = {
+            "author": author,
+            "warehouse_id": warehouse_id,
+            "delivery_type": delivery_type,
+            "shipment_date": datetime.now().strftime("%Y-%m-%d"),
+            "wb_warehouse": "",
+        }
 
         for supply_info in supply_ids:
-            supply_orders = [str(order_id) for order_id in supply_info.order_ids]
-
-            wild_orders = {}
-            for order_id in supply_orders:
-                if order_id in order_wild_map:
-                    wild_code = order_wild_map[order_id]
-                    if wild_code not in wild_orders:
-                        wild_orders[wild_code] = 0
-                    wild_orders[wild_code] += 1
+            wild_orders = Counter(
+                order_wild_map[order_id]
+                for order_id in map(str, supply_info.order_ids)
+                if order_id in order_wild_map
+            )
 
             if not wild_orders:
                 logger.warning(f"Для поставки {supply_info.supply_id} не найдено соответствий wild-кодов")
@@ -1614,13 +1738,9 @@ class SuppliesService:
 
             for wild_code, quantity in wild_orders.items():
                 shipment_data = {
-                    "author": author,
+                    **base_data,
                     "supply_id": supply_info.supply_id,
                     "product_id": wild_code,
-                    "warehouse_id": warehouse_id,
-                    "delivery_type": delivery_type,
-                    "shipment_date": datetime.now().strftime("%Y-%m-%d"),
-                    "wb_warehouse": "",
                     "account": supply_info.account,
                     "quantity": quantity
                 }
@@ -1672,7 +1792,8 @@ class SuppliesService:
         """
         logger.info(f'Входные данные : {shipment_data}')
         response_text = await self.async_client.post(
-            settings.SHIPMENT_API_URL, json=shipment_data)
+            settings.SHIPMENT_API_URL, data=orjson.dumps(shipment_data),
+            headers={"Content-Type": "application/json"})
 
         if response_text:
             try:
@@ -1722,93 +1843,87 @@ class SuppliesService:
         hanging_supplies_model = HangingSupplies(self.db)
         return await hanging_supplies_model.get_order_data_by_supplies(supply_ids)
 
-    def _get_shipped_order_ids(self, shipped_orders) -> set:
+    def _get_shipped_order_ids(self, shipped_orders) -> frozenset:
         """Извлекает множество ID уже отгруженных заказов."""
         if isinstance(shipped_orders, str):
             try:
-                shipped_orders = json.loads(shipped_orders)
-            except json.JSONDecodeError:
+                shipped_orders = orjson.loads(shipped_orders)
+            except orjson.JSONDecodeError:
                 shipped_orders = []
 
-        shipped_order_ids = set()
-        if shipped_orders and isinstance(shipped_orders, list):
-            for shipped_order in shipped_orders:
-                if isinstance(shipped_order, dict) and "order_id" in shipped_order:
-                    shipped_order_ids.add(shipped_order["order_id"])
-        return shipped_order_ids
+        if not shipped_orders or not isinstance(shipped_orders, list):
+            return frozenset()
+        return frozenset(
+            shipped_order["order_id"] for shipped_order in shipped_orders
+            if isinstance(shipped_order, dict) and shipped_order.get("order_id")
+        )
 
     def _filter_available_orders(self, orders_list: List[dict], shipped_order_ids: set, supply_id: str, account: str) -> \
             List[dict]:
         """Фильтрует доступные (не отгруженные) заказы для одной поставки."""
-        result = []
-        for order in orders_list:
-            if order["id"] not in shipped_order_ids:
-                # Безопасное получение полей с правильными названиями из БД
-                created_at = order.get("created_at", order.get("createdAt", ""))  # Пробуем оба варианта
-                created_at_ts = 0
+        return [
+            self._build_available_order(order, supply_id, account)
+            for order in orders_list
+            if order["id"] not in shipped_order_ids
+        ]
 
-                if created_at:
-                    try:
-                        created_at_ts = datetime.fromisoformat(created_at.replace('Z', '+00:00')).timestamp()
-                    except (ValueError, AttributeError):
-                        logger.warning(f"Не удалось обработать created_at для заказа {order.get('id')}: {created_at}")
-                        created_at_ts = 0
+    @staticmethod
+    def _build_available_order(order: dict, supply_id: str, account: str) -> dict:
+        """Формирует запись доступного заказа из данных заказа в БД."""
+        # Безопасное получение полей с правильными названиями из БД
+        created_at = order.get("created_at", order.get("createdAt", ""))  # Пробуем оба варианта
+        created_at_ts = 0
 
-                order_data = {
-                    "supply_id": supply_id,
-                    "account": account,
-                    "order_id": order["id"],
-                    "created_at_ts": created_at_ts,
-                    "created_at": created_at,
-                    "article": order.get("article", ""),
-                    "nm_id": order.get("nmId", order.get("nm_id", 0)),  # Пробуем оба варианта
-                    "price": order.get("price", order.get("convertedPrice", 0))  # Пробуем оба варианта
-                }
-                result.append(order_data)
+        if created_at:
+            try:
+                created_at_ts = _iso_to_timestamp(created_at)
+            except (ValueError, AttributeError, TypeError):
+                logger.warning(f"Не удалось обработать created_at для заказа {order.get('id')}: {created_at}")
+                created_at_ts = 0
 
-        return result
+        return {
+            "supply_id": supply_id,
+            "account": account,
+            "order_id": order["id"],
+            "created_at_ts": created_at_ts,
+            "created_at": created_at,
+            "article": order.get("article", ""),
+            "nm_id": order.get("nmId", order.get("nm_id", 0)),  # Пробуем оба варианта
+            "price": order.get("price", order.get("convertedPrice", 0))  # Пробуем оба варианта
+        }
 
     def _deserialize_order_data(self, order_data_raw: Any, supply_id: str) -> dict:
-        """Десериализует order_data из БД."""
-        if isinstance(order_data_raw, str):
+        """Десериализует order_data из БД (строка или байты JSON; уже разобранный dict возвращается как есть)."""
+        if isinstance(order_data_raw, (str, bytes)):
             try:
-                return json.loads(order_data_raw)
-            except json.JSONDecodeError as e:
+                return orjson.loads(order_data_raw)
+            except orjson.JSONDecodeError as e:
                 logger.error(f"Ошибка десериализации order_data для поставки {supply_id}: {e}")
                 raise HTTPException(status_code=500, detail=f"Ошибка данных поставки {supply_id}")
         return order_data_raw
 
-    def _validate_request_orders(self, request_orders: dict, db_orders_map: dict, supply_id: str) -> None:
-        """Валидирует, что заказы из запроса существуют в БД."""
-        for order_id in request_orders.keys():
-            if order_id not in db_orders_map:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Заказ {order_id} не найден в БД для поставки {supply_id}"
-                )
-
-    def _enrich_order_with_request_data(self, db_order: dict, request_order) -> dict:
-        """Обогащает данные заказа из БД данными из запроса."""
-        return {
-            **db_order,  # Данные из БД (createdAt, convertedPrice, article, id)
-            "nmId": request_order.nm_id,  # nm_id из запроса
-            "local_vendor_code": request_order.local_vendor_code  # На всякий случай
-        }
-
     def _process_request_orders(self, request_orders: dict, orders_list: List[dict],
                                 shipped_order_ids: set, supply_id: str, account: str) -> Tuple[List[dict], int]:
-        """Обрабатывает заказы из запроса."""
+        """
+        Обрабатывает заказы из запроса за один проход: проверка наличия в БД,
+        отсев отгруженных и формирование записи с nm_id из запроса.
+        """
         db_orders_map = {order["id"]: order for order in orders_list}
-        self._validate_request_orders(request_orders, db_orders_map, supply_id)
 
-        filtered_orders = []
+        available_orders = []
         for order_id, request_order in request_orders.items():
-            if order_id not in shipped_order_ids:
-                db_order = db_orders_map[order_id]
-                enriched_order = self._enrich_order_with_request_data(db_order, request_order)
-                filtered_orders.append(enriched_order)
+            db_order = db_orders_map.get(order_id)
+            if db_order is None:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Заказ {order_id} не найден в БД для поставки {supply_id}"
+                )
+            if order_id in shipped_order_ids:
+                continue
+            order_data = self._build_available_order(db_order, supply_id, account)
+            order_data["nm_id"] = request_order.nm_id  # nm_id из запроса
+            available_orders.append(order_data)
 
-        available_orders = self._filter_available_orders(filtered_orders, shipped_order_ids, supply_id, account)
         shipped_count = len(request_orders) - len(available_orders)
 
         logger.info(
@@ -1851,31 +1966,37 @@ class SuppliesService:
         Returns:
             List[dict]: Отсортированный список доступных заказов (исключая уже отгруженные)
         """
-        all_orders = []
+        # Заказы поставок собираются кусками и объединяются один раз перед сортировкой
+        chunks: List[List[dict]] = []
         total_shipped = 0
 
         if request_supplies:
-            request_orders_map = {}
-            for supply in request_supplies:
-                request_orders_map[supply.supply_id] = {order.order_id: order for order in supply.orders}
+            request_orders_map = {
+                supply.supply_id: {order.order_id: order for order in supply.orders}
+                for supply in request_supplies
+            }
 
             for supply_id, data in hanging_data.items():
-                if supply_id not in request_orders_map:
+                request_orders = request_orders_map.get(supply_id)
+                if request_orders is None:
                     logger.warning(f"Поставка {supply_id} не найдена в запросе")
                     continue
 
-                available_orders, shipped_count = self._process_supply_orders(supply_id, data,
-                                                                              request_orders_map[supply_id])
-                all_orders.extend(available_orders)
+                available_orders, shipped_count = self._process_supply_orders(supply_id, data, request_orders)
+                chunks.append(available_orders)
                 total_shipped += shipped_count
         else:
             for supply_id, data in hanging_data.items():
                 available_orders, shipped_count = self._process_supply_orders(supply_id, data)
-                all_orders.extend(available_orders)
+                chunks.append(available_orders)
                 total_shipped += shipped_count
 
-        # FIFO сортировка: сначала по времени создания, затем по order_id
-        all_orders.sort(key=lambda x: (x["created_at_ts"], x["order_id"]))
+        # FIFO сортировка: сначала по времени создания, затем по order_id.
+        # Заказы каждой поставки сортируются отдельно (обычно уже упорядочены), затем K списков сливаются
+        fifo_key = itemgetter("created_at_ts", "order_id")
+        for chunk in chunks:
+            chunk.sort(key=fifo_key)
+        all_orders = list(heapq.merge(*chunks, key=fifo_key))
         logger.info(
             f"Обработано заказов из {len(hanging_data)} поставок: {total_shipped} уже отгружено, {len(all_orders)} доступно для отгрузки")
 
@@ -1896,39 +2017,42 @@ class SuppliesService:
             grouped[supply_id].append(order)
 
         logger.info(f"Заказы сгруппированы по {len(grouped)} поставкам")
-        return dict(grouped)
+        # Отключаем фабрику вместо копирования в dict: отсутствующий ключ снова дает KeyError
+        grouped.default_factory = None
+        return grouped
 
     def _prepare_shipment_data(self, grouped_orders: Dict[str, List[dict]], timestamp: str) -> List[Tuple[str, str]]:
         """Подготавливает данные для batch обновления shipped_orders."""
         update_data = []
+        get_fields = itemgetter(*SHIPPED_ORDER_FIELDS)
         for supply_id, orders in grouped_orders.items():
+            # Пустая конкатенация все равно перезаписала бы jsonb-колонку целиком
+            if not orders:
+                continue
             shipped_orders_data = [
-                {
-                    "order_id": order["order_id"],
-                    "supply_id": order["supply_id"],
-                    "account": order["account"],
-                    "article": order["article"],
-                    "nm_id": order["nm_id"],
-                    "price": order["price"],
-                    "created_at": order["created_at"],
-                    "shipped_at": timestamp
-                }
+                dict(zip(SHIPPED_ORDER_FIELDS, get_fields(order)), shipped_at=timestamp)
                 for order in orders
             ]
-            update_data.append((supply_id, json.dumps(shipped_orders_data)))
+            update_data.append((supply_id, orjson.dumps(shipped_orders_data).decode()))
         return update_data
 
     async def _execute_batch_update(self, update_data: List[Tuple[str, str]]):
-        """Выполняет batch обновление hanging_supplies."""
+        """Выполняет batch обновление hanging_supplies одним запросом через unnest."""
+        if not update_data:
+            return
+
         query = """
-            UPDATE hanging_supplies 
-            SET shipped_orders = shipped_orders || $2::jsonb
-            WHERE supply_id = $1
+            UPDATE hanging_supplies h
+            SET shipped_orders = h.shipped_orders || u.shipped_data
+            FROM unnest($1::text[], $2::jsonb[]) AS u(supply_id, shipped_data)
+            WHERE h.supply_id = u.supply_id
         """
+        supply_ids = [supply_id for supply_id, _ in update_data]
+        shipped_data = [data for _, data in update_data]
 
         try:
-            for supply_id, shipped_data in update_data:
-                await self.db.execute(query, supply_id, shipped_data)
+            await self.db.execute(query, supply_ids, shipped_data)
+            HangingSupplies.invalidate_cache()
             logger.info(f"Обновлено {len(update_data)} записей в hanging_supplies")
         except Exception as e:
             logger.error(f"Ошибка при обновлении hanging_supplies: {str(e)}")
@@ -2763,7 +2887,7 @@ class SuppliesService:
                 account = order.get('account')
                 if old_supply_id and account and old_supply_id not in supplies_dict:
                     supplies_dict[old_supply_id] = account
-                    logger.debug(f"Добавлен старый supply_id в словарь: {old_supply_id} ({account})")
+                    logger.debug("Добавлен старый supply_id в словарь: {} ({})", old_supply_id, account)
 
             logger.info(
                 f"Отправка в 1C/Shipment: "
@@ -2911,7 +3035,8 @@ class SuppliesService:
             url_with_params = f"{api_url}?delivery_type={settings.PRODUCT_RESERVATION_DELIVERY_TYPE}"
 
             logger.info(f"📡 Отправка запроса: {url_with_params}")
-            logger.debug(f"📄 Данные: {json.dumps(reservation_data, ensure_ascii=False, indent=2)}")
+            logger.opt(lazy=True).debug(
+                "📄 Данные: {}", lambda: json.dumps(reservation_data, ensure_ascii=False, indent=2))
 
             response = None
             #     await self.async_client.post(
@@ -3015,7 +3140,8 @@ class SuppliesService:
             key = (order['wild_code'], order['account'])
             if key in new_supplies:
                 updated_order['supply_id'] = new_supplies[key]
-                logger.debug(f"Обновлен supply_id для заказа {order['id']}: {order.get('original_supply_id', 'N/A')} -> {new_supplies[key]}")
+                logger.debug("Обновлен supply_id для заказа {}: {} -> {}",
+                             order['id'], order.get('original_supply_id', 'N/A'), new_supplies[key])
             else:
                 logger.warning(f"Не найдено новое supply_id для заказа {order['id']} ({key})")
                 
@@ -3209,20 +3335,29 @@ class SuppliesService:
             "_shipment_success": shipment_success  # Успешность отгрузки в 1C/Shipment (только для финального режима)
         }
 
-    def _group_orders_by_supply(self, selected_orders: List[dict]) -> Tuple[Dict[str, dict], Dict[str, str]]:
-        """Группирует заказы по поставкам и создает маппинг заказов."""
+    def _group_orders_by_supply(self, selected_orders: List[dict]) -> Tuple[
+        Dict[str, List[dict]], Dict[str, dict], Dict[str, str]]:
+        """
+        За один проход группирует заказы по поставкам (полные и компактные данные)
+        и создает маппинг заказов на wild.
+        """
+        grouped = defaultdict(list)
         supply_orders = defaultdict(lambda: {"order_ids": [], "account": None})
         order_wild_map = {}
 
         for order in selected_orders:
             supply_id = order["supply_id"]
+            grouped[supply_id].append(order)
             # Поддерживаем оба варианта ключа (для заблокированных заказов - 'id', для обычных - 'order_id')
             order_id = order.get('id') if 'id' in order else order.get('order_id')
             supply_orders[supply_id]["order_ids"].append(order_id)
             supply_orders[supply_id]["account"] = order["account"]
             order_wild_map[str(order_id)] = process_local_vendor_code(order["article"])
 
-        return dict(supply_orders), order_wild_map
+        # Отключаем фабрики вместо копирования в dict: отсутствующий ключ снова дает KeyError
+        grouped.default_factory = None
+        supply_orders.default_factory = None
+        return grouped, supply_orders, order_wild_map
 
     def _build_delivery_supplies(self, supply_orders: Dict[str, dict]) -> List[DeliverySupplyInfo]:
         """Создает объекты DeliverySupplyInfo из группированных заказов."""
@@ -3236,19 +3371,20 @@ class SuppliesService:
         ]
 
     def prepare_data_for_delivery_optimized(self, selected_orders: List[dict]) -> Tuple[
-        List[DeliverySupplyInfo], Dict[str, str]]:
+        Dict[str, List[dict]], List[DeliverySupplyInfo], Dict[str, str]]:
         """
         Оптимизированная подготовка данных для 1C и отгрузки.
         Args:
             selected_orders: Список отобранных заказов
         Returns:
-            Tuple[List[DeliverySupplyInfo], Dict[str, str]]: Данные для доставки и маппинг заказов
+            Tuple[Dict[str, List[dict]], List[DeliverySupplyInfo], Dict[str, str]]:
+                Заказы, сгруппированные по supply_id, данные для доставки и маппинг заказов
         """
-        supply_orders, order_wild_map = self._group_orders_by_supply(selected_orders)
+        grouped_orders, supply_orders, order_wild_map = self._group_orders_by_supply(selected_orders)
         delivery_supplies = self._build_delivery_supplies(supply_orders)
 
         logger.info(f"Подготовлено {len(delivery_supplies)} поставок для доставки")
-        return delivery_supplies, order_wild_map
+        return grouped_orders, delivery_supplies, order_wild_map
 
     def _build_supplies_list(self, grouped_orders: Dict[str, List[dict]]) -> List[SupplyId]:
         """Создает список поставок для генерации QR-кодов."""
@@ -3260,18 +3396,20 @@ class SuppliesService:
 
             account = orders[0]["account"]
 
+            # Данные уже провалидированы на входе API и при чтении из БД - собираем модели без валидации,
+            # применяя вручную только преобразование createdAt, которое выполнил бы валидатор
             orders_list = [
-                OrderSchema(
+                OrderSchema.model_construct(
                     order_id=order["order_id"],
                     local_vendor_code=order["article"],
                     nm_id=order["nm_id"],
-                    createdAt=order["createdAt"]
+                    createdAt=OrderSchema.convert_to_moscow_time(order["createdAt"])
                 )
                 for order in orders
             ]
 
             supplies_list.append(
-                SupplyId(
+                SupplyId.model_construct(
                     name="Тестовая поставка",
                     createdAt="2025-07-19T16:00:00Z",
                     supply_id=supply_id,
@@ -3358,7 +3496,7 @@ class SuppliesService:
         """
         await self.update_hanging_supplies_shipped_orders_batch(grouped_orders)
 
-        integration = OneCIntegration(self.db)
+        integration = self.one_c_integration
         integration_result = await integration.format_delivery_data(delivery_supplies, order_wild_map)
         integration_success = isinstance(integration_result, dict) and integration_result.get("code") == 200
 
@@ -3466,6 +3604,7 @@ class SuppliesService:
         """
         logger.info(f"Начало обработки отгрузки фактического количества: {supply_data.shipped_count} заказов")
 
+        pdf_task = None
         try:
             target_article, all_orders = await self._validate_and_get_data(supply_data)
             selected_orders, grouped_orders = self._select_and_group_orders(all_orders, supply_data.shipped_count)
@@ -3480,9 +3619,9 @@ class SuppliesService:
 
             new_supplies_map = {}
             wb_tokens = get_wb_tokens()
+            timestamp = datetime.now().strftime("%d.%m.%Y_%H:%M")
 
             for account, orders in orders_by_account.items():
-                timestamp = datetime.now().strftime("%d.%m.%Y_%H:%M")
                 supply_name = f"Факт_{target_article}_{timestamp}_{user.get('username', 'auto')}"
 
                 logger.info(f"Создание черновой поставки '{supply_name}' для {account}")
@@ -3594,6 +3733,18 @@ class SuppliesService:
 
             logger.info(f"Продолжаем с {len(orders_with_stickers)} заказами которые получили стикеры")
 
+            # PDF зависит только от уже полученных стикеров - генерируем его параллельно с шагами 6-12.
+            # Данные карточек загружаем заранее: задача PDF не должна использовать соединение с БД одновременно с ними
+            # Ошибка PDF не должна прерывать отгрузку: без данных карточек PDF не формируем
+            try:
+                name_and_photo = await self._get_name_and_photo(
+                    {order.nm_id for supply in supply_ids_schema.supplies for order in supply.orders})
+            except Exception as e:
+                logger.error(f"Ошибка получения данных карточек для PDF стикеров: {str(e)}")
+            else:
+                pdf_task = asyncio.create_task(
+                    self._build_stickers_pdf(supply_ids_schema, stickers_grouped, name_and_photo))
+
             # 6. Перемещаем ТОЛЬКО заказы со стикерами
             logger.info(f"=== ПЕРЕМЕЩЕНИЕ ЗАКАЗОВ СО СТИКЕРАМИ В ПОСТАВКИ ===")
             for account, orders in orders_by_account.items():
@@ -3611,17 +3762,17 @@ class SuppliesService:
                 for order in orders_to_move:
                     order_id = order["order_id"]
                     await supplies_api.add_order_to_supply(supply_id, order_id)
-                    logger.debug(f"Заказ {order_id} перемещен в поставку {supply_id}")
+                    logger.debug("Заказ {} перемещен в поставку {}", order_id, supply_id)
 
             # 7. Переводим новые поставки в статус доставки
             await self._deliver_new_supplies(new_supplies_map)
 
             # 8. Обновляем данные заказов с новыми supply_id (ТОЛЬКО orders_with_stickers!)
             updated_selected_orders = self._update_orders_with_new_supplies(orders_with_stickers, new_supplies_map)
-            updated_grouped_orders = self.group_selected_orders_by_supply(updated_selected_orders)
 
-            # 9. Подготавливаем данные для 1C и shipment_goods
-            delivery_supplies, order_wild_map = self.prepare_data_for_delivery_optimized(updated_selected_orders)
+            # 9. Группируем по поставкам и подготавливаем данные для 1C и shipment_goods за один проход
+            updated_grouped_orders, delivery_supplies, order_wild_map = self.prepare_data_for_delivery_optimized(
+                updated_selected_orders)
 
             # 10. Обновляем висячие поставки (используем orders_with_stickers для правильного подсчета)
             grouped_orders_with_stickers = self.group_selected_orders_by_supply(orders_with_stickers)
@@ -3668,17 +3819,8 @@ class SuppliesService:
             integration_result, success = await self._process_shipment(updated_grouped_orders, delivery_supplies,
                                                                        order_wild_map, user, skip_shipment_api=True)
 
-            # 13. Генерируем PDF переиспользуя УЖЕ полученные стикеры
-            logger.info(f"=== ГЕНЕРАЦИЯ PDF ИЗ УЖЕ ПОЛУЧЕННЫХ СТИКЕРОВ ===")
-            try:
-                self.union_results_stickers(supply_ids_schema, stickers_grouped)
-                grouped_stickers = await self.group_orders_to_wild(supply_ids_schema)
-                stickers_pdf = await collect_images_sticker_to_pdf(grouped_stickers)
-                pdf_stickers = base64.b64encode(stickers_pdf.getvalue()).decode('utf-8')
-                logger.info(f"PDF стикеры сгенерированы для {len(grouped_stickers)} wild-кодов")
-            except Exception as e:
-                logger.error(f"Ошибка генерации PDF стикеров: {str(e)}")
-                pdf_stickers = ""
+            # 13. Дожидаемся PDF, запущенного параллельно с интеграциями
+            pdf_stickers = await pdf_task if pdf_task else ""
 
             response_data = {
                 "success": success,
@@ -3710,6 +3852,35 @@ class SuppliesService:
         except Exception as e:
             logger.error(f"Неожиданная ошибка при отгрузке фактического количества: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Внутренняя ошибка сервера: {str(e)}")
+        finally:
+            if pdf_task and not pdf_task.done():
+                pdf_task.cancel()
+
+    async def _build_stickers_pdf(self, supply_ids_schema: SupplyIdBodySchema,
+                                  stickers_grouped: Dict[str, Dict],
+                                  name_and_photo: Dict[int, Dict[str, Any]]) -> str:
+        """
+        Генерирует PDF переиспользуя УЖЕ полученные стикеры.
+        Не обращается к БД: выполняется параллельно с шагами отгрузки, которые используют то же соединение.
+
+        Args:
+            supply_ids_schema: Поставки с заказами, для которых запрашивались стикеры
+            stickers_grouped: Стикеры, сгруппированные по аккаунтам и поставкам
+            name_and_photo: Данные карточек товаров, загруженные заранее
+        Returns:
+            str: Base64 строка PDF файла или пустая строка при ошибке
+        """
+        logger.info(f"=== ГЕНЕРАЦИЯ PDF ИЗ УЖЕ ПОЛУЧЕННЫХ СТИКЕРОВ ===")
+        try:
+            self.union_results_stickers(supply_ids_schema, stickers_grouped)
+            grouped_stickers = await self.group_orders_to_wild(supply_ids_schema, name_and_photo)
+            # Сборка PDF - чистая CPU-работа, выносим ее из event loop
+            stickers_pdf = await asyncio.to_thread(PDFService().create_sticker_pdf, grouped_stickers)
+            logger.info(f"PDF стикеры сгенерированы для {len(grouped_stickers)} wild-кодов")
+            return base64.b64encode(stickers_pdf.getvalue()).decode('utf-8')
+        except Exception as e:
+            logger.error(f"Ошибка генерации PDF стикеров: {str(e)}")
+            return ""
 
     async def _create_and_transfer_orders(self, selected_orders: List[dict], target_article: str, user: dict) -> Dict[
         str, str]:
@@ -3727,10 +3898,11 @@ class SuppliesService:
 
         new_supplies_map = {}
         wb_tokens = get_wb_tokens()
+        # Одна метка времени на весь запрос: поставки всех аккаунтов создаются одновременно
+        timestamp = datetime.now().strftime("%d.%m.%Y_%H:%M")
 
         for account, orders in orders_by_account.items():
             # Создаем имя поставки
-            timestamp = datetime.now().strftime("%d.%m.%Y_%H:%M")
             supply_name = f"Факт_{target_article}_{timestamp}_{user.get('username', 'auto')}"
 
             logger.info(f"Создание поставки '{supply_name}' для аккаунта {account} с {len(orders)} заказами")
@@ -3754,7 +3926,7 @@ class SuppliesService:
                 order_id = order["order_id"]
                 transfer_response = await supplies_api.add_order_to_supply(new_supply_id, order_id)
 
-                logger.debug(f"Заказ {order_id} перемещен в поставку {new_supply_id}")
+                logger.debug("Заказ {} перемещен в поставку {}", order_id, new_supply_id)
 
             new_supplies_map[account] = new_supply_id
 
@@ -3827,29 +3999,18 @@ class SuppliesService:
         Returns:
             List[Dict[str, Any]]: Подготовленные данные для API
         """
-        shipped_goods_data = []
-
-        for supply_id, orders in grouped_orders.items():
-            if not orders:
-                continue
-
-            quantity_shipped = len(orders)
-
-            # Висячая поставка = один wild, получаем product_id из первого заказа
-            product_id = process_local_vendor_code(orders[0].get("article", ""))
-
-            shipped_goods_item = {
+        # Висячая поставка = один wild, получаем product_id из первого заказа
+        shipped_goods_data = [
+            {
                 "supply_id": supply_id,
-                "quantity_shipped": quantity_shipped,
-                "product_id": product_id  # Добавлено для корректного снятия резерва
+                "quantity_shipped": len(orders),
+                "product_id": process_local_vendor_code(orders[0].get("article", ""))  # Для корректного снятия резерва
             }
+            for supply_id, orders in grouped_orders.items()
+            if orders
+        ]
 
-            shipped_goods_data.append(shipped_goods_item)
-            logger.debug(
-                f"Подготовлены данные для поставки {supply_id}, "
-                f"product_id {product_id}: отгружено {quantity_shipped} заказов"
-            )
-
+        logger.debug("Подготовлены данные об отгрузке для {} поставок", len(shipped_goods_data))
         return shipped_goods_data
 
     async def _send_shipped_goods_to_api(self, shipped_goods_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
@@ -3866,7 +4027,10 @@ class SuppliesService:
             api_url = settings.SHIPPED_GOODS_API_URL
 
             logger.info(f"Отправка запроса на URL: {api_url}")
-            logger.debug(f"Данные для отправки: {json.dumps(shipped_goods_data, ensure_ascii=False, indent=2)}")
+            logger.opt(lazy=True).debug(
+                "Данные для отправки: {}",
+                lambda: orjson.dumps(shipped_goods_data, option=orjson.OPT_INDENT_2).decode()
+            )
 
             response = None
             #     await self.async_client.post(
@@ -3879,12 +4043,12 @@ class SuppliesService:
                 logger.info(f"Успешная отправка данных об отгруженных количествах. Ответ: {response}")
                 # Ожидаем ответ в формате: [{"supply_id": "string", "product_reserves_id": 0}]
                 try:
-                    response_data = json.loads(response) if isinstance(response, str) else response
+                    response_data = orjson.loads(response) if isinstance(response, (str, bytes)) else response
                     if isinstance(response_data, list):
                         return response_data
                     logger.error(f"Неожиданный формат ответа от API add_shipped_goods: {response_data}")
                     return []
-                except (json.JSONDecodeError, TypeError) as e:
+                except (orjson.JSONDecodeError, TypeError) as e:
                     logger.error(f"Ошибка парсинга ответа от API add_shipped_goods: {e}")
                     return []
             else:
@@ -3930,7 +4094,7 @@ class SuppliesService:
             if isinstance(item, dict) and 'supply_id' in item and 'product_reserves_id' in item:
                 reserves_mapping[item['supply_id']] = item['product_reserves_id']
 
-        logger.debug(f"Маппинг резервов: {reserves_mapping}")
+        logger.debug("Маппинг резервов: {}", reserves_mapping)
         return reserves_mapping
 
     def _prepare_delivery_data(self, updated_selected_orders: List[dict]) -> Tuple[List, Dict[str, str]]:
@@ -4062,37 +4226,27 @@ class SuppliesService:
         """
         logger.info(f'Генерация PDF стикеров для новых поставок с артикулом: {target_article}')
 
-        # Группируем заказы по новым поставкам
+        # Группируем заказы по новым поставкам за один проход: пара (account, supply_id) должна быть новой поставкой
+        new_supply_pairs = set(new_supplies_map.items())
+        supply_accounts = {supply_id: account for account, supply_id in new_supplies_map.items()}
         supplies_data = defaultdict(list)
         for order in updated_selected_orders:
-            supply_id = order["supply_id"]
-            account = order["account"]
-
-            # Проверяем, что это новая поставка
-            if account in new_supplies_map and new_supplies_map[account] == supply_id:
-                supplies_data[supply_id].append({
-                    "account": account,
-                    "order_id": order["order_id"]
-                })
+            if (order["account"], order["supply_id"]) in new_supply_pairs:
+                supplies_data[order["supply_id"]].append(order["order_id"])
 
         if not supplies_data:
             logger.warning("Нет данных для генерации PDF стикеров новых поставок")
             return ""
 
         # Подготавливаем данные в формате WildFilterRequest
-        from src.supplies.schema import WildFilterRequest, WildSupplyItem, WildOrderItem
-
-        wild_supply_items = []
-        for supply_id, orders in supplies_data.items():
-            if orders:
-                account = orders[0]["account"]
-                wild_supply_items.append(
-                    WildSupplyItem(
-                        account=account,
-                        supply_id=supply_id,
-                        orders=[WildOrderItem(order_id=order["order_id"]) for order in orders]
-                    )
-                )
+        wild_supply_items = [
+            WildSupplyItem(
+                account=supply_accounts[supply_id],
+                supply_id=supply_id,
+                orders=[WildOrderItem(order_id=order_id) for order_id in order_ids]
+            )
+            for supply_id, order_ids in supplies_data.items()
+        ]
 
         wild_filter = WildFilterRequest(
             wild=target_article,
@@ -4103,12 +4257,9 @@ class SuppliesService:
         logger.info(f"Генерация PDF стикеров для {len(wild_supply_items)} новых поставок")
         result_stickers = await self.filter_and_fetch_stickers_by_wild(wild_filter)
 
-        # Импортируем функцию для создания PDF
-        from src.service.service_pdf import collect_images_sticker_to_pdf
         pdf_sticker = await collect_images_sticker_to_pdf(result_stickers)
 
         # Конвертируем PDF в base64 для передачи
-        import base64
         pdf_base64 = base64.b64encode(pdf_sticker.getvalue()).decode('utf-8')
 
         logger.info(f"PDF стикеры сгенерированы успешно для артикула {target_article}")
@@ -4220,7 +4371,7 @@ class SuppliesService:
                     png_data = base64.b64decode(response["file"])
                     png_images.append(png_data)
                     successful_supplies.append(f"{supply_id} ({account})")
-                    logger.debug(f"Successfully processed sticker for supply {supply_id} (account: {account})")
+                    logger.debug("Successfully processed sticker for supply {} (account: {})", supply_id, account)
                 except Exception as e:
                     logger.error(f"Error decoding sticker for supply {supply_id} (account: {account}): {e}")
                     continue
@@ -4228,13 +4379,8 @@ class SuppliesService:
             if not png_images:
                 raise ValueError("No valid stickers found for any of the provided supplies")
 
-            # Combine PNG images vertically
-            combined_image = self._combine_png_images_vertically(png_images)
-
-            # Convert combined image back to BytesIO
-            output_buffer = BytesIO()
-            combined_image.save(output_buffer, format='PNG')
-            output_buffer.seek(0)
+            # Combine PNG images vertically and encode off the event loop (pure CPU work)
+            output_buffer = await asyncio.to_thread(self._combine_png_images_to_buffer, png_images)
 
             logger.info(f"Successfully combined {len(png_images)} stickers for supplies: {successful_supplies}")
             return output_buffer
@@ -4244,6 +4390,23 @@ class SuppliesService:
         except Exception as e:
             raise Exception(f"Multiple stickers error: {str(e)}")
 
+    def _combine_png_images_to_buffer(self, png_data_list: List[bytes]) -> BytesIO:
+        """
+        Combine PNG images vertically and encode the result as PNG.
+        Synchronous, intended to be run via asyncio.to_thread.
+
+        Args:
+            png_data_list: List of PNG image data as bytes
+
+        Returns:
+            BytesIO: Combined PNG image, rewound to the start
+        """
+        combined_image = self._combine_png_images_vertically(png_data_list)
+        output_buffer = BytesIO()
+        combined_image.save(output_buffer, format='PNG')
+        output_buffer.seek(0)
+        return output_buffer
+
     def _combine_png_images_vertically(self, png_data_list: List[bytes]) -> Image.Image:
         """
         Combine multiple PNG images vertically into a single image.
@@ -4628,7 +4791,7 @@ class SuppliesService:
             )
 
             # 5. Отправляем в 1C
-            integration = OneCIntegration(self.db)
+            integration = self.one_c_integration
             integration_result = await integration.format_delivery_data(delivery_supplies, order_wild_map)
             integration_success = isinstance(integration_result, dict) and integration_result.get("code") == 200
 
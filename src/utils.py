@@ -5,16 +5,31 @@ from fastapi import HTTPException
 from src.excel_data.service import ExcelDataService
 import json
 from src.logger import app_logger as logger
-from typing import Callable
+from types import MappingProxyType
+from typing import Callable, Mapping
 from functools import wraps
 
+WB_TOKENS_CACHE: Mapping[str, str] | None = None
 
-def get_wb_tokens() -> dict:
+
+def _load_wb_tokens() -> dict:
     tokens_path = Path(__file__).parent / "tokens.json"
     with tokens_path.open("r", encoding="utf-8") as file:
         return json.load(file)
 
 
+def get_wb_tokens() -> Mapping[str, str]:
+    """
+    Возвращает токены WB из tokens.json.
+    Файл читается один раз на процесс, результат отдаётся как неизменяемое
+    отображение, поэтому вызывающий код не может случайно испортить общий кэш.
+    """
+    global WB_TOKENS_CACHE
+    if WB_TOKENS_CACHE is None:
+        WB_TOKENS_CACHE = MappingProxyType(_load_wb_tokens())
+    return WB_TOKENS_CACHE
+
+
 def process_local_vendor_code(s):
     # Шаблон для извлечения "wild" и цифр
     wild_pattern = r'^wild(\d+).*$'